@@ -0,0 +1,39 @@
+from time import time_ns
+
+from recipes.models import Version
+
+
+def get_versions(names):
+    """Текущие версии справочников и рецептов одним запросом.
+
+    Версии хранятся в базе, поэтому смена версии в любом процессе сразу
+    видна остальным, а кэши в памяти процессов проверяются по ней.
+    Версия, которую ещё не меняли, равна нулю.
+    """
+    versions = dict.fromkeys(names, 0)
+    versions.update(Version.objects.filter(name__in=versions).values_list(
+        'name', 'value'
+    ))
+    return versions
+
+
+def get_version(name):
+    """Текущая версия справочника."""
+    return get_versions([name])[name]
+
+
+def bump_versions(names):
+    """Сменить версии на текущее время, создав недостающие строки."""
+    names = list(names)
+    value = time_ns()
+    if Version.objects.filter(name__in=names).update(
+        value=value
+    ) < len(names):
+        Version.objects.bulk_create([
+            Version(name=name, value=value) for name in names
+        ], ignore_conflicts=True)
+        Version.objects.filter(name__in=names).update(value=value)
+
+
+def bump_version(name):
+    bump_versions([name])
@@ -1,14 +1,33 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe
+from api.pantry import MATCH_ANY, MATCH_CHOICES, PantryResult, pantry_index
+from api.tag_index import get_tag_ids, tag_choices
+from recipes.models import Favorite, Recipe, ShoppingList
+from recipes.search import search_recipes
+
+
+MEMBERSHIP_MODELS = {
+    'is_favorited': Favorite,
+    'is_in_shopping_cart': ShoppingList,
+}
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Список чисел через запятую."""
 
 
 class RecipeFilter(filters.FilterSet):
     """Фильтрация рецептов."""
 
-    is_favorited = filters.Filter(field_name='is_favorited')
-    is_in_shopping_cart = filters.Filter(field_name='is_in_shopping_cart')
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    is_favorited = filters.BooleanFilter(method='filter_membership')
+    is_in_shopping_cart = filters.BooleanFilter(method='filter_membership')
+    tags = filters.MultipleChoiceFilter(choices=tag_choices,
+                                        method='filter_tags')
+    search = filters.CharFilter(method='filter_search')
+    ingredients = NumberInFilter(method='filter_pantry')
+    match = filters.ChoiceFilter(choices=MATCH_CHOICES, method='filter_match')
+    pantry = None
 
     class Meta:
         model = Recipe
@@ -16,15 +35,61 @@ class RecipeFilter(filters.FilterSet):
             'is_favorited',
             'is_in_shopping_cart',
             'author',
-            'tags'
+            'tags',
+            'search',
+            'ingredients',
+            'match'
         ]
 
+    def filter_membership(self, queryset, name, value):
+        user = getattr(self.request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return queryset.none() if value else queryset
+        recipe_ids = MEMBERSHIP_MODELS[name].objects.filter(
+            user=user
+        ).values('recipe_id')
+        if value:
+            return queryset.filter(pk__in=recipe_ids)
+        return queryset.exclude(pk__in=recipe_ids)
 
-class IngredientFilter(filters.FilterSet):
-    """Фильтрация ингредиентов."""
+    def filter_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value if slug in tag_ids]
+        )))
 
-    name = filters.CharFilter(lookup_expr='istartswith')
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def filter_pantry(self, queryset, name, value):
+        # Подбор применяется в RecipeFilterBackend после остальных
+        # фильтров: порядок и страницы считаются по индексу в памяти.
+        self.pantry = (
+            {int(ingredient_id) for ingredient_id in value
+             if ingredient_id is not None},
+            self.form.cleaned_data.get('match') or MATCH_ANY
+        )
+        return queryset
+
+    def filter_match(self, queryset, name, value):
+        return queryset
+
+
+class RecipeFilterBackend(filters.DjangoFilterBackend):
+    """Фильтры рецептов с подбором по ингредиентам для списка."""
+
+    filterset = None
+
+    def get_filterset(self, request, queryset, view):
+        self.filterset = super().get_filterset(request, queryset, view)
+        return self.filterset
+
+    def filter_queryset(self, request, queryset, view):
+        queryset = super().filter_queryset(request, queryset, view)
+        pantry = getattr(self.filterset, 'pantry', None)
+        if pantry is None or getattr(view, 'action', None) != 'list':
+            return queryset
+        return PantryResult(queryset, pantry_index.match(*pantry))
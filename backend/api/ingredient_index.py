@@ -0,0 +1,75 @@
+import logging
+from bisect import bisect_left
+from collections import namedtuple
+from threading import Lock
+
+from django.db import DatabaseError
+
+from api.catalog import get_version
+from recipes.models import Ingredient
+
+logger = logging.getLogger(__name__)
+
+IngredientState = namedtuple('IngredientState',
+                             ('version', 'keys', 'items', 'by_id'))
+
+
+class IngredientIndex:
+    """Индекс справочника ингредиентов в памяти процесса.
+
+    Названия хранятся отсортированными в нижнем регистре, поиск по началу
+    названия выполняется бинарным поиском. Индекс перестраивается, когда
+    меняется версия справочника. Состояние заменяется целиком, поэтому
+    чтение идёт без блокировки.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state = IngredientState(None, [], [], {})
+
+    def build(self, version):
+        items = sorted(Ingredient.objects.all(),
+                       key=lambda item: (item.name.casefold(), item.id))
+        return IngredientState(
+            version, [item.name.casefold() for item in items], items,
+            {item.id: item for item in items}
+        )
+
+    def ensure(self):
+        version = get_version('ingredients')
+        state = self._state
+        if state.version == version:
+            return state
+        with self._lock:
+            state = self._state
+            if state.version != version:
+                state = self._state = self.build(version)
+        return state
+
+    def warm(self):
+        try:
+            self.ensure()
+        except DatabaseError:
+            logger.warning('Не удалось построить индекс ингредиентов.',
+                           exc_info=True)
+
+    def all(self):
+        return self.ensure().items
+
+    def get(self, pk):
+        return self.ensure().by_id.get(pk)
+
+    def search(self, prefix, limit):
+        state = self.ensure()
+        keys, items = state.keys, state.items
+        prefix = prefix.casefold()
+        result = []
+        index = bisect_left(keys, prefix)
+        while (index < len(keys) and len(result) < limit
+               and keys[index].startswith(prefix)):
+            result.append(items[index])
+            index += 1
+        return result
+
+
+ingredient_index = IngredientIndex()
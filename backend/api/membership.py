@@ -0,0 +1,140 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from recipes.models import Favorite, Follow, ShoppingList
+
+Membership = namedtuple('Membership',
+                        ('favorites', 'shopping_cart', 'following'))
+
+EMPTY_MEMBERSHIP = Membership(frozenset(), frozenset(), frozenset())
+
+
+class LocalMembershipBackend:
+    """LRU-хранилище в памяти процесса.
+
+    Подходит, когда приложение работает в одном процессе. При нескольких
+    процессах нужно общее хранилище, иначе изменения, сделанные в одном
+    процессе, не будут видны в остальных до истечения timeout.
+    """
+
+    def __init__(self, max_size=10000, timeout=300):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                return None
+            expires, membership = entry
+            if expires < monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return membership
+
+    def set(self, user_id, membership):
+        with self._lock:
+            self._data[user_id] = (monotonic() + self.timeout, membership)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+
+class DjangoCacheMembershipBackend:
+    """Хранилище в общем кэше Django (memcached, redis и т. п.)."""
+
+    def __init__(self, alias='default', timeout=300,
+                 key_prefix='membership'):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def get(self, user_id):
+        return self.cache.get(self.make_key(user_id))
+
+    def set(self, user_id, membership):
+        self.cache.set(self.make_key(user_id), membership, self.timeout)
+
+    def delete(self, user_id):
+        self.cache.delete(self.make_key(user_id))
+
+
+class MembershipCache:
+    """Кэш избранного, списка покупок и подписок пользователя.
+
+    Для каждого пользователя хранятся множества id рецептов в избранном и
+    в списке покупок и id авторов, на которых он подписан. Хранилище
+    задаётся настройкой MEMBERSHIP_CACHE. При промахе множества
+    загружаются из базы, по запросу на каждое.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = getattr(settings, 'MEMBERSHIP_CACHE', {})
+            backend_class = import_string(config.get(
+                'BACKEND', 'api.membership.LocalMembershipBackend'
+            ))
+            self._backend = backend_class(**config.get('OPTIONS', {}))
+        return self._backend
+
+    def load(self, user_id):
+        return Membership(
+            favorites=frozenset(Favorite.objects.filter(
+                user_id=user_id
+            ).values_list('recipe_id', flat=True)),
+            shopping_cart=frozenset(ShoppingList.objects.filter(
+                user_id=user_id
+            ).values_list('recipe_id', flat=True)),
+            following=frozenset(Follow.objects.filter(
+                user_id=user_id
+            ).values_list('author_id', flat=True)),
+        )
+
+    def get(self, user):
+        if not user.is_authenticated:
+            return EMPTY_MEMBERSHIP
+        membership = self.backend.get(user.id)
+        if membership is None:
+            membership = self.load(user.id)
+            self.backend.set(user.id, membership)
+        return membership
+
+    def invalidate(self, user):
+        self.backend.delete(user.id)
+
+    def invalidate_on_commit(self, user):
+        """Сбрасывает кэш пользователя после фиксации транзакции.
+
+        Запись удаляется, а не исправляется на месте: так откат транзакции
+        не оставит в кэше несуществующих данных, а параллельные изменения
+        одного пользователя не затрут друг друга.
+        """
+        user_id = user.id
+        transaction.on_commit(lambda: self.backend.delete(user_id))
+
+
+membership_cache = MembershipCache()
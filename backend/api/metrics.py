@@ -0,0 +1,267 @@
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.serializers import BaseSerializer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = 'unmatched'
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class RouteMetrics:
+    """Метрики одного маршрута и метода."""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0
+        self.serialize_seconds = 0
+        self.render_seconds = 0
+
+
+class MetricsRegistry:
+    """Метрики запросов в памяти процесса.
+
+    Значения копятся с момента запуска процесса; при нескольких воркерах
+    каждый отдаёт свои, и Prometheus различает их по адресу цели.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._routes = {}
+
+    def record(self, route, method, stats, duration):
+        with self._lock:
+            metrics = self._routes.get((route, method))
+            if metrics is None:
+                metrics = self._routes[(route, method)] = RouteMetrics()
+            metrics.latency.observe(duration)
+            metrics.queries.observe(stats.queries)
+            metrics.db_seconds += stats.db_seconds
+            metrics.serialize_seconds += stats.serialize_seconds
+            metrics.render_seconds += stats.render_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return sorted(self._routes.items())
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+
+
+registry = MetricsRegistry()
+
+
+class RequestStats:
+    """Счётчики одного запроса."""
+
+    __slots__ = ('queries', 'db_seconds', 'serialize_seconds',
+                 'render_seconds', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0
+        self.serialize_seconds = 0
+        self.render_seconds = 0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += perf_counter() - started
+            self.queries += 1
+
+    @contextmanager
+    def counting(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield
+
+
+@contextmanager
+def serializing():
+    stats = current_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializing = False
+        stats.serialize_seconds += perf_counter() - started
+
+
+def install_serializer_metrics():
+    """Учёт времени serializer.data во всех сериализаторах DRF.
+
+    Serializer.data и ListSerializer.data обращаются к BaseSerializer.data,
+    поэтому обёртки на нём хватает для любых вьюх, в том числе djoser.
+    Вложенные вызовы .data (сериализатор внутри сериализатора) входят во
+    время внешнего и повторно не считаются.
+    """
+    data = BaseSerializer.data.fget
+
+    def timed_data(self):
+        with serializing():
+            return data(self)
+
+    BaseSerializer.data = property(timed_data)
+
+
+class MetricsMiddleware:
+    """Сбор метрик по маршрутам: время ответа, число и время SQL-запросов,
+    время сериализации и отрисовки ответа DRF.
+
+    Запросы к базе считаются через connection.execute_wrapper, время
+    отрисовки через post-render callback ответа. Тело потокового ответа
+    читается под тем же счётчиком запросов, и метрики записываются после
+    его отдачи.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        request.metrics = stats
+        token = current_stats.set(stats)
+        started = perf_counter()
+        try:
+            with stats.counting():
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        def finish():
+            duration = perf_counter() - started
+            match = getattr(request, 'resolver_match', None)
+            route = match.view_name if match else UNMATCHED_ROUTE
+            registry.record(route, request.method, stats, duration)
+
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, stats, finish
+            )
+        else:
+            finish()
+        return response
+
+    def stream(self, content, stats, finish):
+        content = iter(content)
+        try:
+            while True:
+                with stats.counting():
+                    chunk = next(content, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            finish()
+
+    def process_template_response(self, request, response):
+        stats = request.metrics
+        started = perf_counter()
+
+        def rendered(response):
+            stats.render_seconds += perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def format_labels(**labels):
+    return ','.join(
+        f'{name}="{escape(value)}"' for name, value in labels.items()
+    )
+
+
+def render_metrics(routes):
+    """Метрики в текстовом формате Prometheus."""
+    histograms = (
+        ('foodgram_request_duration_seconds', 'latency',
+         'Время обработки запроса.'),
+        ('foodgram_request_queries', 'queries',
+         'Число SQL-запросов на запрос.'),
+    )
+    counters = (
+        ('foodgram_request_db_seconds_total', 'db_seconds',
+         'Суммарное время SQL-запросов.'),
+        ('foodgram_request_serialize_seconds_total', 'serialize_seconds',
+         'Суммарное время сериализации DRF.'),
+        ('foodgram_request_render_seconds_total', 'render_seconds',
+         'Суммарное время отрисовки ответа DRF.'),
+    )
+    lines = []
+    for name, attribute, help_text in histograms:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (route, method), metrics in routes:
+            histogram = getattr(metrics, attribute)
+            labels = format_labels(route=route, method=method)
+            for bound, total in histogram.cumulative():
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} '
+                             f'{total}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {sum(histogram.counts)}')
+    for name, attribute, help_text in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (route, method), metrics in routes:
+            labels = format_labels(route=route, method=method)
+            lines.append(f'{name}{{{labels}}} {getattr(metrics, attribute)}')
+    return '\n'.join(lines) + '\n'
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Метрики запросов для Prometheus."""
+    return HttpResponse(
+        render_metrics(registry.snapshot()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,7 +1,197 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from itertools import chain
+from operator import attrgetter
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     """Кастомный пагинатор."""
 
     page_size_query_param = 'limit'
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса вместо COUNT(*).
+
+    На PostgreSQL берётся оценка планировщика из EXPLAIN, на остальных
+    базах выполняется обычный COUNT.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class RecipeCursorPagination(BasePagination):
+    """Курсорная пагинация ленты рецептов по ключу (pub_date, id).
+
+    Включается параметром cursor (для первой страницы он пустой). Страница
+    выбирается условием по индексу без OFFSET, поэтому стоимость не зависит
+    от глубины. Поле count по умолчанию не считается: count=approx отдаёт
+    оценку планировщика, count=exact — точное значение. Выборку с другим
+    порядком (поиск по релевантности) курсор не листает: запрос получает
+    400, такие выборки листаются параметром page.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    page_size = 6
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+    key_field = 'pk'
+    invalid_cursor_message = 'Неверный курсор.'
+    invalid_ordering_message = (
+        'Курсор листает только по дате публикации, для поиска используйте '
+        'параметр page.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = self.get_count(queryset, request)
+        page = self.get_page(queryset, self.decode_cursor(request))
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_page(self, queryset, position):
+        ordering = queryset.query.order_by
+        if ordering and tuple(ordering) != self.ordering:
+            raise ValidationError({
+                self.cursor_query_param: self.invalid_ordering_message
+            })
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, **{f'{self.key_field}__lt': pk})
+            )
+        return list(queryset[:self.page_size + 1])
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'approx':
+            return estimate_count(queryset)
+        return None
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            return self.parse_position(value)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_position(self, value):
+        pub_date, pk = value.rsplit('|', 1)
+        pub_date, pk = parse_datetime(pub_date), int(pk)
+        if pub_date is None:
+            raise ValueError(value)
+        return pub_date, pk
+
+    def format_position(self, recipe):
+        key = getattr(recipe, self.key_field)
+        return f'{recipe.pub_date.isoformat()}|{key}'
+
+    def encode_cursor(self, recipe):
+        value = self.format_position(recipe)
+        return urlsafe_b64encode(value.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last)
+        )
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['results'] = data
+        return Response(response)
+
+
+class FeedCursorPagination(RecipeCursorPagination):
+    """Курсорная пагинация ленты подписок по ключу (pub_date, recipe_id).
+
+    Лента собирается из нескольких запросов: из каждого берётся страница
+    после курсора, и страницы сливаются по тому же ключу. Курсор всегда
+    включён, для первой страницы параметр не передаётся.
+    """
+
+    ordering = ('-pub_date', '-recipe_id')
+    key_field = 'recipe_id'
+
+    def get_page(self, sources, position):
+        get_page = super().get_page
+        pages = [get_page(source, position) for source in sources]
+        return sorted(chain(*pages), key=attrgetter('pub_date', 'recipe_id'),
+                      reverse=True)
+
+    def get_count(self, sources, request):
+        get_count = super().get_count
+        counts = [get_count(source, request) for source in sources]
+        if None in counts:
+            return None
+        return sum(counts)
+
+
+class PantryCursorPagination(RecipeCursorPagination):
+    """Курсорная пагинация подбора по ингредиентам.
+
+    Ключ (missing_count, pub_date, id) совпадает с порядком подбора,
+    страница после курсора берётся из PantryResult без запроса ключей к
+    базе. Число найденных известно заранее и отдаётся при любом count.
+    """
+
+    def get_page(self, result, position):
+        return result.after(position, self.page_size + 1)
+
+    def get_count(self, result, request):
+        if request.query_params.get(self.count_query_param):
+            return len(result)
+        return None
+
+    def parse_position(self, value):
+        missing, value = value.split('|', 1)
+        return (int(missing), *super().parse_position(value))
+
+    def format_position(self, recipe):
+        return f'{recipe.missing_count}|{super().format_position(recipe)}'
@@ -0,0 +1,219 @@
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from threading import Lock
+
+from django.db.models import Max
+
+from api.catalog import get_version
+from recipes.models import IngredientInRecipe, RecipeChange
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+MATCH_ONLY = 'only'
+
+MATCH_CHOICES = (
+    (MATCH_ALL, 'Есть все указанные ингредиенты'),
+    (MATCH_ANY, 'Есть хотя бы один из указанных ингредиентов'),
+    (MATCH_ONLY, 'Рецепт целиком из указанных ингредиентов'),
+)
+
+MAX_CHANGES = 1000
+
+PantryState = namedtuple('PantryState',
+                         ('version', 'sequence', 'recipes', 'postings'))
+
+
+def recipe_changed(recipe_id):
+    """Записать рецепт в журнал изменений индекса.
+
+    Журнал хранится в базе, его видят все процессы с индексом в памяти и
+    перечитывают только изменённые рецепты. Хранятся последние
+    MAX_CHANGES записей: процесс, отставший сильнее, перестраивает индекс
+    целиком, как и при смене версии 'recipes' (массовая загрузка).
+    """
+    change = RecipeChange.objects.create(recipe_id=recipe_id)
+    RecipeChange.objects.filter(id__lte=change.id - MAX_CHANGES).delete()
+
+
+def last_change():
+    return RecipeChange.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def read_recipes(rows):
+    """Ингредиенты и ключ сортировки (-pub_date, -id) рецептов."""
+    recipes = {}
+    ingredients = defaultdict(set)
+    for recipe_id, pub_date, ingredient_id in rows:
+        recipes[recipe_id] = (-pub_date.timestamp(), -recipe_id)
+        ingredients[recipe_id].add(ingredient_id)
+    return {
+        recipe_id: (order, frozenset(ingredients[recipe_id]))
+        for recipe_id, order in recipes.items()
+    }
+
+
+def recipe_rows(queryset):
+    return queryset.values_list(
+        'recipe_id', 'recipe__pub_date', 'ingredient_id'
+    ).iterator()
+
+
+class PantryIndex:
+    """Обратный индекс «ингредиент → рецепты» в памяти процесса.
+
+    Для каждого рецепта хранится множество его ингредиентов и ключ
+    сортировки, для каждого ингредиента множество рецептов с ним. Индекс
+    строится одним запросом при смене версии рецептов, отдельные
+    изменения подтягиваются по журналу RecipeChange. Состояние
+    заменяется целиком, поэтому чтение идёт без блокировки.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state = PantryState(None, 0, {}, {})
+
+    def build(self, version, sequence):
+        recipes = read_recipes(recipe_rows(IngredientInRecipe.objects))
+        postings = defaultdict(set)
+        for recipe_id, (_, ingredients) in recipes.items():
+            for ingredient_id in ingredients:
+                postings[ingredient_id].add(recipe_id)
+        return PantryState(version, sequence, recipes, {
+            ingredient_id: frozenset(recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        })
+
+    def update(self, state, recipe_ids, sequence):
+        changed = read_recipes(recipe_rows(
+            IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+        ))
+        recipes = dict(state.recipes)
+        postings = dict(state.postings)
+        for recipe_id in recipe_ids:
+            _, old = recipes.pop(recipe_id, (None, frozenset()))
+            _, new = changed.get(recipe_id, (None, frozenset()))
+            if recipe_id in changed:
+                recipes[recipe_id] = changed[recipe_id]
+            for ingredient_id in old - new:
+                postings[ingredient_id] = postings[ingredient_id] - {
+                    recipe_id
+                }
+            for ingredient_id in new - old:
+                postings[ingredient_id] = postings.get(
+                    ingredient_id, frozenset()
+                ) | {recipe_id}
+        return PantryState(state.version, sequence, recipes, postings)
+
+    def changes(self, state):
+        return list(RecipeChange.objects.filter(
+            id__gt=state.sequence
+        ).order_by('id').values_list('id', 'recipe_id')[:MAX_CHANGES + 1])
+
+    def refresh(self, state, version, changes):
+        if (changes is None or len(changes) > MAX_CHANGES
+                or changes[-1][0] - state.sequence > MAX_CHANGES):
+            return self.build(version, last_change())
+        return self.update(state, {recipe_id for _, recipe_id in changes},
+                           changes[-1][0])
+
+    def ensure(self):
+        version = get_version('recipes')
+        state = self._state
+        changes = None
+        if state.version == version:
+            changes = list(RecipeChange.objects.filter(
+                id__gt=state.sequence
+            ).order_by('id').values_list(
+                'id', 'recipe_id'
+            )[:MAX_CHANGES + 1])
+            if not changes:
+                return state
+        with self._lock:
+            if self._state is state:
+                self._state = self.refresh(state, version, changes)
+            return self._state
+
+    def match(self, pantry, mode=MATCH_ANY):
+        """Рецепты для набора ингредиентов pantry.
+
+        Возвращает отсортированный список ключей
+        (число недостающих ингредиентов, -pub_date, -id).
+        """
+        state = self.ensure()
+        recipes, postings = state.recipes, state.postings
+        pantry = frozenset(pantry)
+        candidates = [postings.get(ingredient_id, frozenset())
+                      for ingredient_id in pantry]
+        if not candidates:
+            return []
+        if mode == MATCH_ALL:
+            recipe_ids = frozenset.intersection(*candidates)
+        else:
+            recipe_ids = frozenset.union(*candidates)
+        keys = []
+        for recipe_id in recipe_ids:
+            order, ingredients = recipes[recipe_id]
+            missing = len(ingredients - pantry)
+            if mode != MATCH_ONLY or not missing:
+                keys.append((missing, *order))
+        keys.sort()
+        return keys
+
+
+pantry_index = PantryIndex()
+
+
+class PantryResult:
+    """Подобранные рецепты в порядке (недостающие, -pub_date, -id).
+
+    Порядок, число и страницы считаются по ключам из индекса, из базы
+    читаются только рецепты страницы. Остальные фильтры queryset
+    применяются одним запросом id: по кандидатам, если их немного,
+    иначе по всей выборке.
+    """
+
+    filter_limit = 1000
+
+    def __init__(self, queryset, keys):
+        queryset = queryset.order_by()
+        if keys and queryset.query.has_filters():
+            allowed = queryset
+            if len(keys) <= self.filter_limit:
+                allowed = queryset.filter(pk__in=[-key[2] for key in keys])
+            allowed = set(allowed.values_list('pk', flat=True))
+            keys = [key for key in keys if -key[2] in allowed]
+        self.queryset = queryset
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def count(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.fetch(self.keys))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.fetch(self.keys[index])
+        return self.fetch([self.keys[index]])[0]
+
+    def after(self, position, size):
+        """size рецептов после позиции курсора (missing, pub_date, id)."""
+        start = 0
+        if position is not None:
+            missing, pub_date, pk = position
+            start = bisect_right(self.keys,
+                                 (missing, -pub_date.timestamp(), -pk))
+        return self.fetch(self.keys[start:start + size])
+
+    def fetch(self, keys):
+        recipes = self.queryset.in_bulk([-key[2] for key in keys])
+        page = []
+        for missing, _, recipe_id in keys:
+            recipe = recipes.get(-recipe_id)
+            if recipe is not None:
+                recipe.missing_count = missing
+                page.append(recipe)
+        return page
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from api.catalog import bump_version, get_versions
+from recipes.models import IngredientInRecipe
+
+RECIPE_BODY_PREFETCH = (
+    'tags',
+    Prefetch(
+        'ingredientinrecipe_set',
+        queryset=IngredientInRecipe.objects.select_related(
+            'ingredient'
+        ).only(
+            'recipe', 'amount', 'ingredient__name',
+            'ingredient__measurement_unit'
+        )
+    ),
+)
+
+CATALOGS = ('tags', 'ingredients')
+
+
+def version_name(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def bump_recipe_version(recipe_id):
+    bump_version(version_name(recipe_id))
+
+
+def get_recipe_bodies(recipes, serializer_class):
+    """Общая для всех пользователей часть представления рецептов.
+
+    Тело рецепта кэшируется по id рецепта, его версии и версиям
+    справочников тегов и ингредиентов. Все версии читаются из базы одним
+    запросом, поэтому смену версии в другом процессе видят все воркеры.
+    Версия читается до загрузки данных, поэтому тело, собранное до
+    изменения рецепта, никогда не попадёт под новую версию. Для промахов
+    теги и ингредиенты подгружаются одним prefetch на все рецепты.
+    """
+    versions = get_versions([
+        *CATALOGS, *(version_name(recipe.id) for recipe in recipes)
+    ])
+    catalog = ':'.join(str(versions[name]) for name in CATALOGS)
+    keys = {
+        recipe.id: 'recipe-body:{}:{}:{}'.format(
+            recipe.id, versions[version_name(recipe.id)], catalog
+        )
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    bodies = {
+        recipe_id: cached[key] for recipe_id, key in keys.items()
+        if key in cached
+    }
+    missing = [recipe for recipe in recipes if recipe.id not in bodies]
+    if missing:
+        prefetch_related_objects(missing, *RECIPE_BODY_PREFETCH)
+        fresh = {
+            recipe.id: serializer_class(recipe).data for recipe in missing
+        }
+        cache.set_many(
+            {keys[recipe_id]: body for recipe_id, body in fresh.items()},
+            settings.RECIPE_CACHE_TIMEOUT
+        )
+        bodies.update(fresh)
+    return bodies
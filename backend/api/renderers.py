@@ -0,0 +1,115 @@
+import csv
+import json
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Строки списка отдаются потоком через stream(), по умолчанию каждая
+    строка форматируется format_row() в текст. render() используется
+    только для ответов с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def stream(self, rows):
+        for row in rows:
+            yield self.format_row(row)
+
+    def format_row(self, row):
+        return (f"{row['ingredient__name']}, "
+                f"{row['ingredient__measurement_unit']} - "
+                f"{row['total_amount']};\n\n")
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    """Список покупок в виде текста."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for row in rows:
+            yield writer.writerow((
+                row['ingredient__name'],
+                row['ingredient__measurement_unit'],
+                row['total_amount'],
+            ))
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """Список покупок в формате PDF.
+
+    В отличие от txt и csv документ собирается в памяти целиком и
+    отдаётся одним куском: таблица ссылок PDF пишется в конце файла,
+    а reportlab не умеет выводить готовые страницы по частям. Строк в
+    списке не больше, чем ингредиентов в справочнике, поэтому документ
+    остаётся небольшим.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    def register_font(self):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+
+    def stream(self, rows):
+        self.register_font()
+        buffer = BytesIO()
+        page = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - self.margin
+        page.setFont(self.font_name, self.font_size + 4)
+        page.drawString(self.margin, y, 'Список покупок')
+        y -= self.line_height * 2
+        page.setFont(self.font_name, self.font_size)
+        for row in rows:
+            if y < self.margin:
+                page.showPage()
+                page.setFont(self.font_name, self.font_size)
+                y = height - self.margin
+            page.drawString(
+                self.margin, y,
+                f"{row['ingredient__name']} "
+                f"({row['ingredient__measurement_unit']}) — "
+                f"{row['total_amount']}"
+            )
+            y -= self.line_height
+        page.save()
+        yield buffer.getvalue()
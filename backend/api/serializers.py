@@ -1,15 +1,34 @@
 import base64
+import binascii
+import json
+from collections import Counter, OrderedDict
 
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
 from djoser.serializers import UserSerializer
 
-from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
-                            Recipe, ShoppingList, Tag)
+from api.membership import membership_cache
+from api.recipe_cache import get_recipe_bodies
+from recipes.images import build_srcset
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingList,
+                            ShoppingListIngredient, Tag)
 from users.models import User
 
 
+def get_membership(context):
+    """Избранное, список покупок и подписки текущего пользователя.
+
+    Загружается один раз на сериализацию и сохраняется в контексте.
+    """
+    if 'membership' not in context:
+        context['membership'] = membership_cache.get(context['request'].user)
+    return context['membership']
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов."""
 
@@ -35,12 +54,20 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """Уменьшенные копии фото в виде srcset для каждого формата."""
+
+    def to_representation(self, value):
+        return build_srcset(value, self.context.get('request'))
+
+
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Упрощённый сериализатор рецепта."""
 
     id = serializers.ReadOnlyField()
     name = serializers.ReadOnlyField()
     image = serializers.ImageField(read_only=True)
+    image_srcset = ImageSrcsetField(source='image_variants')
     cooking_time = serializers.ReadOnlyField()
 
     class Meta:
@@ -48,6 +75,7 @@ class RecipeShortSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_srcset',
             'cooking_time'
         )
         model = Recipe
@@ -75,8 +103,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 class IngredientInRecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов в рецепте для записи."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all(),
-                                            source='ingredient.id')
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit'
@@ -117,26 +144,100 @@ class CustomUserSerializer(UserSerializer):
         model = User
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return user.is_authenticated and user.follower.filter(
-            author=obj).exists()
+        return obj.id in get_membership(self.context).following
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор рецепта."""
+class RecipeBodySerializer(serializers.ModelSerializer):
+    """Общая для всех пользователей часть рецепта.
+
+    Сериализуется без запроса в контексте, поэтому ссылки на изображения
+    в ней относительные.
+    """
 
-    is_favorited = serializers.BooleanField(read_only=True)
-    is_in_shopping_cart = serializers.BooleanField(read_only=True)
     tags = TagSerializer(many=True)
-    author = CustomUserSerializer()
     ingredients = IngredientInRecipeSerializer(source='ingredientinrecipe_set',
                                                many=True, read_only=True)
 
     class Meta:
-        exclude = ('pub_date',)
+        fields = (
+            'id',
+            'tags',
+            'ingredients',
+            'name',
+            'image',
+            'image_variants',
+            'text',
+            'cooking_time'
+        )
         model = Recipe
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов с общими частями, загруженными из кэша разом."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        self.context['recipe_bodies'] = get_recipe_bodies(
+            recipes, RecipeBodySerializer
+        )
+        return super().to_representation(recipes)
+
+
+class RecipeSerializer(serializers.ModelSerializer):
+    """Сериализатор рецепта.
+
+    Теги, ингредиенты и поля рецепта берутся из кэша общих частей,
+    поверх них накладываются автор и флаги текущего пользователя.
+    """
+
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    author = CustomUserSerializer()
+
+    class Meta:
+        fields = (
+            'id',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'author'
+        )
+        model = Recipe
+        list_serializer_class = RecipeListSerializer
+
+    def get_is_favorited(self, obj):
+        return obj.id in get_membership(self.context).favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        return obj.id in get_membership(self.context).shopping_cart
+
+    def get_body(self, instance):
+        bodies = self.context.get('recipe_bodies', {})
+        if instance.id not in bodies:
+            bodies = get_recipe_bodies([instance], RecipeBodySerializer)
+        return bodies[instance.id]
+
+    def to_representation(self, instance):
+        body = self.get_body(instance)
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        image = body['image']
+        if image and request is not None:
+            image = request.build_absolute_uri(image)
+        return OrderedDict((
+            ('id', data['id']),
+            ('is_favorited', data['is_favorited']),
+            ('is_in_shopping_cart', data['is_in_shopping_cart']),
+            ('tags', body['tags']),
+            ('author', data['author']),
+            ('ingredients', body['ingredients']),
+            ('name', body['name']),
+            ('image', image),
+            ('image_srcset', build_srcset(body['image_variants'], request)),
+            ('text', body['text']),
+            ('cooking_time', body['cooking_time']),
+        ))
+
+
 def func_validate(self, model):
     if (self.context['request'].method == 'POST'
             and model.objects.filter(
@@ -162,6 +263,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
     image = serializers.ImageField(source='recipe.image', read_only=True)
+    image_srcset = ImageSrcsetField(source='recipe.image_variants')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
 
     class Meta:
@@ -169,6 +271,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_srcset',
             'cooking_time'
         )
         model = Favorite
@@ -178,6 +281,26 @@ class FavoriteSerializer(serializers.ModelSerializer):
         return data
 
 
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return recipes_limit if recipes_limit >= 0 else None
+
+
+class FollowListSerializer(serializers.ListSerializer):
+    """Список подписок с рецептами авторов, загруженными одним запросом."""
+
+    def to_representation(self, data):
+        follows = list(data.all() if hasattr(data, 'all') else data)
+        self.context['recipes'] = Recipe.objects.latest_by_authors(
+            [follow.author_id for follow in follows],
+            get_recipes_limit(self.context['request'])
+        )
+        return super().to_representation(follows)
+
+
 class FollowSerializer(serializers.ModelSerializer):
     """Сериализатор подписок."""
 
@@ -202,6 +325,7 @@ class FollowSerializer(serializers.ModelSerializer):
             'recipes_count'
         )
         model = Follow
+        list_serializer_class = FollowListSerializer
 
     def validate(self, data):
         if self.context['request'].method == 'POST' and Follow.objects.filter(
@@ -228,41 +352,84 @@ class FollowSerializer(serializers.ModelSerializer):
         return data
 
     def get_recipes(self, obj):
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit'
-        )
-        queryset = obj.author.recipes.all()
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
-        serializer = RecipeShortSerializer(queryset, many=True)
+        if 'recipes' in self.context:
+            recipes = self.context['recipes'].get(obj.author_id, [])
+        else:
+            recipes = Recipe.objects.latest_by_authors(
+                [obj.author_id],
+                get_recipes_limit(self.context['request'])
+            )[obj.author_id]
+        serializer = RecipeShortSerializer(recipes, many=True)
         return serializer.data
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(user=self.context['request'].user,
-                                     author=obj.author).exists()
+        return True
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+        return obj.author.recipes_count
 
 
 class Base64ImageField(serializers.ImageField):
-    """Сериализатор поля изображения."""
+    """Сериализатор поля изображения.
+
+    Принимает как файл из multipart-запроса, так и строку base64.
+    """
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            if len(imgstr) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+                raise serializers.ValidationError(
+                    f'Размер файла больше '
+                    f'{settings.RECIPE_IMAGE_MAX_SIZE} байт.'
+                )
+            try:
+                content = base64.b64decode(imgstr)
+            except binascii.Error:
+                raise serializers.ValidationError('Неверная строка base64.')
+            data = ContentFile(content, name='temp.' + ext)
 
         return super().to_internal_value(data)
 
 
+def parse_multipart(data, json_fields):
+    """Данные multipart-формы со списками в полях json_fields.
+
+    Список передаётся строкой JSON-массива или повторением поля; каждое
+    значение повторяемого поля — скаляр или строка JSON-объекта.
+    """
+    result = data.dict()
+    for field in json_fields:
+        values = data.getlist(field)
+        if not values:
+            continue
+        items = []
+        for value in values:
+            stripped = value.strip()
+            if not stripped.startswith(('[', '{')):
+                items.append(value)
+                continue
+            try:
+                parsed = json.loads(stripped)
+            except ValueError:
+                raise serializers.ValidationError({
+                    field: ['Ожидается строка JSON.']
+                })
+            if isinstance(parsed, list):
+                items.extend(parsed)
+            else:
+                items.append(parsed)
+        result[field] = items
+    return result
+
+
 class ShoppingCardSerializer(serializers.ModelSerializer):
     """Сериализатор списка покупок."""
 
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
     image = serializers.ImageField(source='recipe.image', read_only=True)
+    image_srcset = ImageSrcsetField(source='recipe.image_variants')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
 
     class Meta:
@@ -270,6 +437,7 @@ class ShoppingCardSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_srcset',
             'cooking_time'
         )
         model = ShoppingList
@@ -282,14 +450,9 @@ class ShoppingCardSerializer(serializers.ModelSerializer):
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта для записи."""
 
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
     author = CustomUserSerializer(
         read_only=True, default=CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
     ingredients = IngredientInRecipeWriteSerializer(
         many=True,
@@ -302,26 +465,51 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         read_only_fields = ('author',)
         model = Recipe
 
+    def run_validation(self, data=serializers.empty):
+        if hasattr(data, 'getlist'):
+            data = parse_multipart(data, ('tags', 'ingredients'))
+            self.initial_data = data
+        return super().run_validation(data)
+
     def validate(self, data):
-        tags = self.initial_data.get('tags')
-        if not tags:
+        if not data.get('tags'):
             raise serializers.ValidationError(
                 'Не указаны теги.'
             )
-        ingredients = self.initial_data.get('ingredients')
-        if not ingredients:
+        if not data.get('ingredientinrecipe_set'):
             raise serializers.ValidationError(
                 'Не указаны ингредиенты.'
             )
-        ingredients = []
-        for ingredient in self.context['request'].data['ingredients']:
-            if ingredient in ingredients:
-                raise serializers.ValidationError(
-                    'Ингредиенты не должны повторяться.'
-                )
-            ingredients.append(ingredient)
         return data
 
+    def validate_tags(self, value):
+        tags = list(dict.fromkeys(value))
+        missing = set(tags).difference(
+            Tag.objects.filter(id__in=tags).values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f'Теги не найдены: {sorted(missing)}.'
+            )
+        return tags
+
+    def validate_ingredients(self, value):
+        ingredient_ids = {item['ingredient_id'] for item in value}
+        if len(ingredient_ids) != len(value):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться.'
+            )
+        missing = ingredient_ids.difference(
+            Ingredient.objects.filter(id__in=ingredient_ids).values_list(
+                'id', flat=True
+            )
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}.'
+            )
+        return value
+
     def validate_cooking_time(self, value):
         if value <= 0:
             raise serializers.ValidationError(
@@ -329,14 +517,6 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def get_is_favorited(self, obj):
-        return Favorite.objects.filter(user=self.context['request'].user,
-                                       recipe=obj).exists()
-
-    def get_is_in_shopping_cart(self, obj):
-        return ShoppingList.objects.filter(user=self.context['request'].user,
-                                           recipe=obj).exists()
-
     def to_representation(self, instance):
         serializer = RecipeSerializer(
             instance,
@@ -349,24 +529,65 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         for ingredient in ingredients:
             data.append(IngredientInRecipe(
                 recipe=recipe,
-                ingredient=ingredient['ingredient']['id'],
+                ingredient_id=ingredient['ingredient_id'],
                 amount=ingredient['amount']
             ))
         IngredientInRecipe.objects.bulk_create(data)
 
+    def update_ingredients(self, ingredients, recipe):
+        """Изменяет только отличающиеся строки ингредиентов рецепта.
+
+        Возвращает изменение количества {ingredient_id: amount} для
+        изменённых и добавленных строк: bulk_update и bulk_create не шлют
+        сигналов. Удалённые строки вычитаются из списков покупок сигналом
+        post_delete.
+        """
+        amounts = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        delta = Counter()
+        to_update = []
+        to_delete = []
+        for row in recipe.ingredientinrecipe_set.all():
+            if row.ingredient_id not in amounts:
+                to_delete.append(row.pk)
+                continue
+            amount = amounts.pop(row.ingredient_id)
+            if row.amount != amount:
+                delta[row.ingredient_id] += amount - row.amount
+                row.amount = amount
+                to_update.append(row)
+        IngredientInRecipe.objects.filter(pk__in=to_delete).delete()
+        IngredientInRecipe.objects.bulk_update(to_update, ['amount'])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                               amount=amount)
+            for ingredient_id, amount in amounts.items()
+        ])
+        delta.update(amounts)
+        return delta
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredientinrecipe_set')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         self.create_ingredients(ingredients, recipe)
         recipe.tags.set(tags)
+        FeedEntry.objects.add_recipes([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredientinrecipe_set')
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
-        instance.ingredients.set([])
-        instance.save()
-        self.create_ingredients(ingredients, instance)
+        delta = self.update_ingredients(ingredients, instance)
+        ShoppingListIngredient.objects.apply_delta(
+            ShoppingList.objects.filter(recipe=instance).values_list(
+                'user_id', flat=True
+            ),
+            delta
+        )
         return super().update(instance, validated_data)
@@ -0,0 +1,154 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from api import pantry
+from api.catalog import bump_version
+from api.recipe_cache import bump_recipe_version
+from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingList, ShoppingListIngredient, Tag,
+                            update_counter)
+from users.models import User
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(**kwargs):
+    bump_version('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(**kwargs):
+    bump_version('tags')
+
+
+def recipe_changed(recipe_id):
+    transaction.on_commit(lambda: bump_recipe_version(recipe_id))
+
+
+def recipe_ingredients_changed(recipe_id):
+    recipe_changed(recipe_id)
+    transaction.on_commit(lambda: pantry.recipe_changed(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    recipe_ingredients_changed(instance.id)
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def ingredient_in_recipe_saved(instance, **kwargs):
+    recipe_ingredients_changed(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_changed(instance.id)
+        return
+    for recipe_id in pk_set or ():
+        recipe_changed(recipe_id)
+
+
+def cart_user_ids(recipe_id):
+    return ShoppingList.objects.filter(recipe_id=recipe_id).values_list(
+        'user_id', flat=True
+    )
+
+
+# Суммы списков покупок меняются в post_save и post_delete по текущему
+# состоянию базы. При удалении рецепта каскадом удаляются и строки
+# ингредиентов, и строки корзин; та из них, что удаляется второй, уже не
+# находит пары, поэтому вклад рецепта вычитается ровно один раз.
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_list_saved(instance, created, **kwargs):
+    if created:
+        ShoppingListIngredient.objects.add_recipe([instance.user_id],
+                                                  instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingList)
+def shopping_list_deleted(instance, **kwargs):
+    ShoppingListIngredient.objects.remove_recipe([instance.user_id],
+                                                 instance.recipe_id)
+
+
+@receiver(pre_save, sender=IngredientInRecipe)
+def ingredient_in_recipe_saving(instance, **kwargs):
+    instance.saved_amount = None
+    if not instance._state.adding:
+        instance.saved_amount = IngredientInRecipe.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def shopping_list_ingredient_saved(instance, **kwargs):
+    delta = Counter({instance.ingredient_id: instance.amount})
+    saved = getattr(instance, 'saved_amount', None)
+    if saved is not None:
+        ingredient_id, amount = saved
+        delta[ingredient_id] -= amount
+    ShoppingListIngredient.objects.apply_delta(
+        cart_user_ids(instance.recipe_id), delta
+    )
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def shopping_list_ingredient_deleted(instance, **kwargs):
+    ShoppingListIngredient.objects.apply_delta(
+        cart_user_ids(instance.recipe_id),
+        {instance.ingredient_id: -instance.amount}
+    )
+
+
+# Счётчики меняются в сигналах, поэтому их поддерживают и API, и админка,
+# и каскадное удаление. bulk_create сигналов не шлёт, загрузчики
+# обновляют счётчики сами.
+
+@receiver(post_save, sender=Recipe)
+def recipe_counted(instance, created, **kwargs):
+    if created:
+        update_counter(User.objects.filter(pk=instance.author_id),
+                       'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_uncounted(instance, **kwargs):
+    update_counter(User.objects.filter(pk=instance.author_id),
+                   'recipes_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counted(instance, created, **kwargs):
+    if created:
+        update_counter(User.objects.filter(pk=instance.author_id),
+                       'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncounted(instance, **kwargs):
+    update_counter(User.objects.filter(pk=instance.author_id),
+                   'followers_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_counted(instance, created, **kwargs):
+    if created:
+        update_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                       'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_uncounted(instance, **kwargs):
+    update_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                   'favorites_count', -1)
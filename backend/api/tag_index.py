@@ -0,0 +1,18 @@
+from django.core.cache import cache
+
+from api.catalog import get_version
+from recipes.models import Tag
+
+
+def get_tag_ids():
+    """Словарь {slug: id} тегов, кэшируется до изменения справочника."""
+    key = f"tag-ids:{get_version('tags')}"
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, None)
+    return tag_ids
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
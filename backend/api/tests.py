@@ -0,0 +1,588 @@
+import json
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.catalog import bump_version
+from api.membership import membership_cache
+from api.metrics import registry
+from api.pantry import pantry_index
+from api.recipe_cache import bump_recipe_version
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, RecipeChange,
+                            ShoppingList, ShoppingListIngredient, Tag)
+from users.models import User
+
+
+class RecipeQueryCountTests(TestCase):
+    """Число запросов на список и рецепт не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@example.com', username='reader',
+            first_name='Имя', last_name='Фамилия'
+        )
+        User.objects.bulk_create([
+            User(email=f'author{number}@example.com',
+                 username=f'author{number}',
+                 first_name='Имя', last_name='Фамилия')
+            for number in range(5)
+        ])
+        authors = list(User.objects.filter(username__startswith='author'))
+        tags = [
+            Tag.objects.create(name=name, color='#FFFFFF', slug=slug)
+            for name, slug in (('Завтрак', 'breakfast'), ('Ужин', 'dinner'))
+        ]
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        ])
+        ingredients = list(Ingredient.objects.all())
+        for number in range(60):
+            recipe = Recipe.objects.create(
+                name=f'Суп {number}', text='Сварить суп.', cooking_time=10,
+                image='backend-media/recipes/images/soup.png',
+                author=authors[number % len(authors)]
+            )
+            recipe.tags.set(tags[:number % 2 + 1])
+            IngredientInRecipe.objects.bulk_create([
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=100)
+                for ingredient in ingredients[number % 5:number % 5 + 3]
+            ])
+        recipes = list(Recipe.objects.all()[:10])
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[:5]
+        ])
+        ShoppingList.objects.bulk_create([
+            ShoppingList(user=cls.user, recipe=recipe)
+            for recipe in recipes[5:]
+        ])
+        Follow.objects.create(user=cls.user, author=authors[0])
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        cache.clear()
+        membership_cache.invalidate(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, number):
+        with self.assertNumQueries(number):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_queries(self, url, number):
+        """Холодный кэш: страница, автор, теги, ингредиенты и флаги."""
+        for limit in (6, 50):
+            cache.clear()
+            membership_cache.invalidate(self.user)
+            response = self.get(f'{url}limit={limit}', number)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_list(self):
+        self.assert_queries('/api/recipes/?', 8)
+
+    def test_list_cursor(self):
+        self.assert_queries('/api/recipes/?cursor=&', 7)
+
+    def test_list_search(self):
+        self.assert_queries('/api/recipes/?search=суп&', 8)
+
+    def test_search_with_cursor_rejected(self):
+        response = self.client.get('/api/recipes/?search=суп&cursor=')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+
+    def test_list_cached(self):
+        self.client.get('/api/recipes/?limit=50')
+        self.get('/api/recipes/?limit=6', 3)
+        self.get('/api/recipes/?limit=50', 3)
+
+    def test_detail(self):
+        self.get(f'/api/recipes/{self.recipe.id}/', 7)
+        self.get(f'/api/recipes/{self.recipe.id}/', 2)
+
+    def test_detail_bumped_elsewhere(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.client.get(url)
+        Recipe.objects.filter(pk=self.recipe.id).update(name='Борщ')
+        bump_recipe_version(self.recipe.id)
+        self.assertEqual(self.client.get(url).data['name'], 'Борщ')
+
+
+class SubscriptionQueryCountTests(TestCase):
+    """Число запросов на список подписок не зависит от их количества."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@example.com', username='reader',
+            first_name='Имя', last_name='Фамилия'
+        )
+        User.objects.bulk_create([
+            User(email=f'author{number}@example.com',
+                 username=f'author{number}',
+                 first_name='Имя', last_name='Фамилия')
+            for number in range(11)
+        ])
+        cls.authors = list(User.objects.filter(
+            username__startswith='author'
+        ).order_by('id'))
+        Recipe.objects.bulk_create([
+            Recipe(name=f'Суп {author.id}-{number}', text='Сварить суп.',
+                   cooking_time=10, author=author,
+                   image='backend-media/recipes/images/soup.png')
+            for author in cls.authors
+            for number in range(4)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_subscriptions(self):
+        for count in (2, 11):
+            Follow.objects.bulk_create([
+                Follow(user=self.user, author=author)
+                for author in self.authors[:count]
+            ], ignore_conflicts=True)
+            for params in ('', '&recipes_limit=2'):
+                with self.assertNumQueries(3):
+                    response = self.client.get(
+                        f'/api/users/subscriptions/?limit=20{params}'
+                    )
+                self.assertEqual(len(response.data['results']), count)
+                recipes = response.data['results'][0]['recipes']
+                self.assertEqual(len(recipes), 2 if params else 4)
+
+
+class PantryTests(TestCase):
+    """Подбор по ингредиентам: порядок, курсор и обновление индекса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@example.com', username='cook',
+            first_name='Имя', last_name='Фамилия'
+        )
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(8)
+        ])
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        for number in range(30):
+            recipe = Recipe.objects.create(
+                name=f'Салат {number}', text='Нарезать.', cooking_time=5,
+                image='backend-media/recipes/images/salad.png',
+                author=cls.user
+            )
+            IngredientInRecipe.objects.bulk_create([
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=10)
+                for ingredient in cls.ingredients[number % 6:
+                                                  number % 6 + number % 3 + 1]
+            ])
+        cls.pantry = cls.ingredients[:3]
+
+    def setUp(self):
+        cache.clear()
+        bump_version('recipes')
+        self.client = APIClient()
+
+    def url(self, pantry, **params):
+        params['ingredients'] = ','.join(
+            str(ingredient.id) for ingredient in pantry
+        )
+        return '/api/recipes/?' + '&'.join(
+            f'{name}={value}' for name, value in params.items()
+        )
+
+    def expected(self, pantry):
+        pantry = {ingredient.id for ingredient in pantry}
+        keys = []
+        for recipe in Recipe.objects.prefetch_related('ingredients'):
+            ingredients = {ingredient.id
+                           for ingredient in recipe.ingredients.all()}
+            if ingredients & pantry:
+                keys.append((len(ingredients - pantry),
+                             -recipe.pub_date.timestamp(), -recipe.id,
+                             recipe.name))
+        return [key[-1] for key in sorted(keys)]
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, [
+            recipe['name'] for recipe in response.data['results']
+        ]
+
+    def test_page_order(self):
+        data, names = self.names(self.url(self.pantry, limit=100))
+        self.assertEqual(names, self.expected(self.pantry))
+        self.assertEqual(data['count'], len(names))
+
+    def test_cursor_keeps_order(self):
+        url, names = self.url(self.pantry, limit=4, cursor=''), []
+        while url:
+            data, page = self.names(url)
+            names.extend(page)
+            url = data['next']
+        self.assertEqual(names, self.expected(self.pantry))
+
+    def test_page_queries(self):
+        self.client.get(self.url(self.pantry, limit=1))
+        for limit in (6, 50):
+            with self.assertNumQueries(6):
+                self.client.get(self.url(self.pantry, limit=limit))
+
+    def test_changes_update_index(self):
+        self.client.get(self.url(self.pantry, limit=6))
+        version = pantry_index._state.version
+        recipe = Recipe.objects.first()
+        ingredient = Ingredient.objects.create(name='Укроп',
+                                               measurement_unit='г')
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientInRecipe.objects.create(recipe=recipe,
+                                              ingredient=ingredient, amount=1)
+        with self.assertNumQueries(7):
+            data, names = self.names(self.url([ingredient], limit=6))
+        self.assertEqual(names, [recipe.name])
+        self.assertEqual(pantry_index._state.version, version)
+
+    def test_change_journaled_elsewhere(self):
+        self.client.get(self.url(self.pantry, limit=6))
+        recipe = Recipe.objects.first()
+        ingredient = Ingredient.objects.create(name='Укроп',
+                                               measurement_unit='г')
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+        ])
+        cache.clear()
+        RecipeChange.objects.create(recipe_id=recipe.id)
+        data, names = self.names(self.url([ingredient], limit=6))
+        self.assertEqual(names, [recipe.name])
+
+
+class MetricsTests(TestCase):
+    """Метрики учитывают отдачу потокового тела и сериализацию."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='buyer@example.com', username='buyer',
+            first_name='Имя', last_name='Фамилия'
+        )
+        ingredient = Ingredient.objects.create(name='Мука',
+                                               measurement_unit='г')
+        ShoppingListIngredient.objects.create(user=cls.user,
+                                              ingredient=ingredient,
+                                              amount=500)
+        Recipe.objects.create(
+            name='Блины', text='Испечь.', cooking_time=20,
+            image='backend-media/recipes/images/pancakes.png',
+            author=cls.user
+        )
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def metrics(self, route):
+        return dict(registry.snapshot())[(route, 'GET')]
+
+    def test_streaming_queries(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(registry.snapshot(), [])
+        self.assertIn('Мука', b''.join(response.streaming_content).decode())
+        metrics = self.metrics('download_shopping_cart')
+        self.assertEqual(metrics.queries.sum, 1)
+        self.assertGreater(metrics.db_seconds, 0)
+
+    def test_serialize_seconds(self):
+        self.client.get('/api/recipes/?limit=6')
+        self.assertGreater(self.metrics('recipes-list').serialize_seconds, 0)
+
+    def test_serialize_seconds_all_routes(self):
+        recipe = Recipe.objects.get()
+        author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия'
+        )
+        for url in ('/api/users/', '/api/users/me/', '/api/tags/',
+                    '/api/ingredients/'):
+            self.client.get(url)
+        for url in (f'/api/recipes/{recipe.id}/favorite/',
+                    f'/api/recipes/{recipe.id}/shopping_cart/',
+                    f'/api/users/{author.id}/subscribe/'):
+            self.client.post(url)
+        routes = dict(registry.snapshot())
+        self.assertEqual(len(routes), 7)
+        for route, metrics in routes.items():
+            self.assertGreater(metrics.serialize_seconds, 0, route)
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+class FeedTests(TestCase):
+    """Рецепты не пропадают из лент при смене числа подписчиков."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = [
+            User.objects.create(
+                email=f'{username}@example.com', username=username,
+                first_name='Имя', last_name='Фамилия'
+            )
+            for username in ('alice', 'bob', 'carol')
+        ]
+
+    def setUp(self):
+        self.clients = {}
+        for user in (self.bob, self.carol):
+            self.clients[user] = APIClient()
+            self.clients[user].force_authenticate(user)
+
+    def subscribe(self, user, method='post'):
+        response = getattr(self.clients[user], method)(
+            f'/api/users/{self.alice.id}/subscribe/'
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def publish(self, name):
+        recipe = Recipe.objects.create(
+            name=name, text='Готовить.', cooking_time=10,
+            image='backend-media/recipes/images/dish.png', author=self.alice
+        )
+        FeedEntry.objects.add_recipes([recipe.id])
+
+    def feed(self, user):
+        response = self.clients[user].get('/api/recipes/feed/')
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_follower_count_crosses_limit(self):
+        self.subscribe(self.bob)
+        self.publish('r1')
+        self.subscribe(self.carol)
+        self.publish('r2')
+        self.subscribe(self.carol, 'delete')
+        self.assertEqual(self.feed(self.bob), ['r2', 'r1'])
+        self.subscribe(self.carol)
+        self.subscribe(self.bob, 'delete')
+        self.assertEqual(self.feed(self.carol), ['r2', 'r1'])
+        self.assertEqual(self.feed(self.bob), [])
+
+    def test_rebuild(self):
+        self.subscribe(self.bob)
+        self.publish('r1')
+        self.subscribe(self.carol)
+        self.publish('r2')
+        FeedEntry.objects.rebuild()
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed(self.bob), ['r2', 'r1'])
+        self.subscribe(self.carol, 'delete')
+        self.assertEqual(FeedEntry.objects.rebuild(), 2)
+        self.assertEqual(self.feed(self.bob), ['r2', 'r1'])
+
+
+class MembershipCacheTests(TestCase):
+    """Кэш избранного сбрасывается только после фиксации транзакции."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@example.com', username='reader',
+            first_name='Имя', last_name='Фамилия'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Суп', text='Сварить суп.', cooking_time=10,
+            image='backend-media/recipes/images/soup.png', author=cls.user
+        )
+
+    def setUp(self):
+        membership_cache.invalidate(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_favorite(self):
+        self.assertNotIn(self.recipe.id,
+                         membership_cache.get(self.user).favorites)
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertIn(self.recipe.id,
+                      membership_cache.get(self.user).favorites)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertNotIn(self.recipe.id,
+                         membership_cache.get(self.user).favorites)
+
+    def test_rollback_keeps_cache(self):
+        membership_cache.get(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                Favorite.objects.create(user=self.user, recipe=self.recipe)
+                membership_cache.invalidate_on_commit(self.user)
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertNotIn(self.recipe.id,
+                         membership_cache.get(self.user).favorites)
+
+
+class CatalogCacheTests(TestCase):
+    """Кэш справочников учитывает только поддерживаемые параметры."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', color='#FFFFFF', slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unknown_params_share_entry(self):
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tags/?utm_source=1&page=2')
+        self.assertEqual(len(response.json()), 1)
+
+    def test_name_param_is_part_of_key(self):
+        found = self.client.get('/api/ingredients/?name=со').json()
+        missing = self.client.get('/api/ingredients/?name=мука').json()
+        self.assertEqual([item['name'] for item in found], ['соль'])
+        self.assertEqual(missing, [])
+        self.assertEqual(
+            self.client.get('/api/ingredients/?name=со&x=1').json(), found
+        )
+
+    def test_version_bumped_elsewhere(self):
+        self.client.get('/api/ingredients/?name=пе')
+        Ingredient.objects.bulk_create([
+            Ingredient(name='перец', measurement_unit='г')
+        ])
+        bump_version('ingredients')
+        response = self.client.get('/api/ingredients/?name=пе')
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['перец'])
+
+
+class MultipartRecipeTests(TestCase):
+    """Создание рецепта формой multipart/form-data."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@example.com', username='cook',
+            first_name='Имя', last_name='Фамилия'
+        )
+        cls.tags = [
+            Tag.objects.create(name=name, color='#FFFFFF', slug=slug)
+            for name, slug in (('Завтрак', 'breakfast'), ('Ужин', 'dinner'))
+        ]
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, name, tags, ingredients):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(buffer, 'PNG')
+        image = SimpleUploadedFile('soup.png', buffer.getvalue(),
+                                   content_type='image/png')
+        return self.client.post('/api/recipes/', {
+            'name': name, 'text': 'Сварить суп.', 'cooking_time': 10,
+            'image': image, 'tags': tags, 'ingredients': ingredients,
+        }, format='multipart')
+
+    def test_list_formats(self):
+        ingredient = {'id': self.ingredient.id, 'amount': 5}
+        cases = (
+            ([self.tags[0].id], json.dumps([ingredient]), 1),
+            ([tag.id for tag in self.tags], [json.dumps(ingredient)], 2),
+            (json.dumps([tag.id for tag in self.tags]),
+             json.dumps([ingredient]), 2),
+        )
+        for number, (tags, ingredients, tag_count) in enumerate(cases):
+            with self.subTest(tags=tags):
+                response = self.post(f'Суп {number}', tags, ingredients)
+                self.assertEqual(response.status_code, 201, response.data)
+                self.assertEqual(len(response.data['tags']), tag_count)
+                self.assertEqual(len(response.data['ingredients']), 1)
+
+
+class RecipeUpdateTests(TestCase):
+    """Правка рецепта из корзин меняет строки ингредиентов и суммы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.buyer, cls.guest = [
+            User.objects.create(
+                email=f'{username}@example.com', username=username,
+                first_name='Имя', last_name='Фамилия'
+            )
+            for username in ('author', 'buyer', 'guest')
+        ]
+        cls.tag = Tag.objects.create(name='Ужин', color='#FFFFFF',
+                                     slug='dinner')
+        cls.salt, cls.flour, cls.sugar = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'мука', 'сахар')
+        ]
+        cls.bread, cls.soup = [
+            Recipe.objects.create(
+                name=name, text='Готовить.', cooking_time=30,
+                image='backend-media/recipes/images/dish.png',
+                author=cls.author
+            )
+            for name in ('Хлеб', 'Суп')
+        ]
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=cls.bread, ingredient=cls.salt,
+                               amount=5),
+            IngredientInRecipe(recipe=cls.bread, ingredient=cls.flour,
+                               amount=500),
+            IngredientInRecipe(recipe=cls.soup, ingredient=cls.salt,
+                               amount=3),
+        ])
+        for user, recipe in ((cls.buyer, cls.bread), (cls.buyer, cls.soup),
+                             (cls.guest, cls.bread)):
+            ShoppingList.objects.create(user=user, recipe=recipe)
+
+    def totals(self, user):
+        return dict(ShoppingListIngredient.objects.filter(
+            user=user
+        ).values_list('ingredient_id', 'amount'))
+
+    def test_diff_update(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.patch(f'/api/recipes/{self.bread.id}/', {
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': self.flour.id, 'amount': 300},
+                {'id': self.sugar.id, 'amount': 20},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            dict(self.bread.ingredientinrecipe_set.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {self.flour.id: 300, self.sugar.id: 20}
+        )
+        self.assertEqual(self.totals(self.buyer), {
+            self.salt.id: 3, self.flour.id: 300, self.sugar.id: 20
+        })
+        self.assertEqual(self.totals(self.guest), {
+            self.flour.id: 300, self.sugar.id: 20
+        })
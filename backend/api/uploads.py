@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+SNIFF_SIZE = 12
+
+
+def sniff_image_format(header):
+    """Формат изображения по первым байтам файла или None."""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return format
+    return None
+
+
+class UploadRejected(MultiPartParserError):
+    """Загружаемый файл отклонён до окончания загрузки."""
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+    """Потоковая загрузка фото рецепта во временный файл.
+
+    Размер файла ограничен настройкой RECIPE_IMAGE_MAX_SIZE, формат
+    проверяется по первым байтам, поэтому неподходящий файл отклоняется
+    сразу, а не после загрузки целиком.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = settings.RECIPE_IMAGE_MAX_SIZE
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        limit = self.max_size + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+        if content_length > limit:
+            raise UploadRejected('Слишком большой запрос.')
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.size = 0
+        self.header = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            raise UploadRejected(
+                f'Размер файла {self.field_name} больше '
+                f'{self.max_size} байт.'
+            )
+        if len(self.header) < SNIFF_SIZE:
+            self.header += raw_data[:SNIFF_SIZE]
+            if (len(self.header) >= SNIFF_SIZE
+                    and sniff_image_format(self.header) is None):
+                raise UploadRejected(
+                    f'Файл {self.field_name} не является изображением.'
+                )
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if sniff_image_format(self.header) is None:
+            raise UploadRejected(
+                f'Файл {self.field_name} не является изображением.'
+            )
+        return super().file_complete(file_size)
@@ -1,11 +1,12 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from api.utils import download_shopping_cart
+from api.metrics import metrics_view
+from api.utils import download_shopping_cart, export_recipes, import_recipes
 from api.views import (CustomUserViewSet, IngredientViewSet,
                        ListSubscribeViewSet, RecipeViewSet,
                        TagViewSet, add_del_shopping_cart,
-                       add_del_subscribe, favorite_view)
+                       add_del_subscribe, favorite_view, feed_view)
 
 router_v1 = routers.DefaultRouter()
 
@@ -18,6 +19,10 @@ router_v1.register('users', CustomUserViewSet)
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
 
 function_urls = [
+    path('metrics/', metrics_view, name='metrics'),
+    path('recipes/feed/', feed_view, name='feed'),
+    path('recipes/export/', export_recipes, name='export_recipes'),
+    path('recipes/import/', import_recipes, name='import_recipes'),
     path('recipes/download_shopping_cart/', download_shopping_cart,
          name='download_shopping_cart'),
     path('recipes/<int:recipe_id>/shopping_cart/', add_del_shopping_cart,
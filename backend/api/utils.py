@@ -1,30 +1,123 @@
-from django.http import HttpResponse
+import json
+
+from django.db.models import F, Prefetch
+from django.http import StreamingHttpResponse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import (api_view, permission_classes,
+                                       renderer_classes)
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+
+from api.catalog import bump_version
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTextRenderer)
+from recipes.loaders import RecipeLoader, iter_ndjson
+from recipes.models import IngredientInRecipe, Recipe, ShoppingListIngredient
+
+EXPORT_BATCH_SIZE = 500
 
-from recipes.models import IngredientInRecipe
+
+def get_shopping_list(user):
+    """Суммарное количество каждого ингредиента в списке покупок."""
+    return ShoppingListIngredient.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        total_amount=F('amount')
+    ).order_by('ingredient__name')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([ShoppingListTextRenderer, ShoppingListCSVRenderer,
+                   ShoppingListPDFRenderer])
 def download_shopping_cart(request):
-    """Скачать список покупок."""
-    ingredients = IngredientInRecipe.objects.filter(
-        recipe__recipe_to_shopping__user=request.user
+    """Скачать список покупок.
+
+    Формат выбирается параметром format: txt (по умолчанию), csv или pdf.
+    """
+    renderer = request.accepted_renderer
+    rows = get_shopping_list(request.user).iterator()
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    response = StreamingHttpResponse(renderer.stream(rows),
+                                     content_type=content_type,
+                                     status=status.HTTP_200_OK)
+    response['Content-Disposition'] = (
+        f'attachment; filename=shopping-list.{renderer.format}'
+    )
+    return response
+
+
+def iter_recipes(batch_size=EXPORT_BATCH_SIZE):
+    """Рецепты по возрастанию id пачками, без OFFSET."""
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredientinrecipe_set',
+            queryset=IngredientInRecipe.objects.select_related('ingredient')
+        )
+    ).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1].id
+
+
+def recipe_to_row(recipe, request):
+    """Рецепт в формате, который принимает RecipeLoader."""
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'image_url': request.build_absolute_uri(recipe.image.url),
+        'author': recipe.author.username,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredientinrecipe_set.all()
+        ],
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_recipes(request):
+    """Выгрузить все рецепты в формате NDJSON."""
+    rows = (
+        json.dumps(recipe_to_row(recipe, request), ensure_ascii=False) + '\n'
+        for recipe in iter_recipes()
     )
-    shopping_data = {}
-    for ingredient in ingredients:
-        if str(ingredient.ingredient) in shopping_data:
-            shopping_data[f'{str(ingredient.ingredient)}'] += ingredient.amount
-        else:
-            shopping_data[f'{str(ingredient.ingredient)}'] = ingredient.amount
-    filename = 'shopping-list.txt'
-    content = ''
-    for ingredient, amount in shopping_data.items():
-        content += f"{ingredient} - {amount};\n\n"
-    response = HttpResponse(content, content_type='text/plain',
-                            status=status.HTTP_200_OK)
-    response['Content-Disposition'] = 'attachment; filename={0}'.format(
-        filename)
+    response = StreamingHttpResponse(
+        rows, content_type='application/x-ndjson; charset=utf-8'
+    )
+    response['Content-Disposition'] = 'attachment; filename=recipes.ndjson'
     return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def import_recipes(request):
+    """Загрузить рецепты из NDJSON в теле запроса.
+
+    Строки читаются из запроса потоком и вставляются пачками в одной
+    транзакции; при ошибке не сохраняется ничего. Рецепты с уже
+    занятым названием пропускаются.
+    """
+    loader = RecipeLoader()
+    lines = iter(request.stream.readline, b'') if request.stream else ()
+    try:
+        processed = loader.load(iter_ndjson(lines))
+    except (ValueError, KeyError, TypeError) as error:
+        return Response({'errors': str(error)},
+                        status=status.HTTP_400_BAD_REQUEST)
+    bump_version('recipes')
+    return Response({'processed': processed}, status=status.HTTP_200_OK)
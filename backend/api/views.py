@@ -1,39 +1,64 @@
-from django.db.models import Exists, OuterRef, Value
+from django.conf import settings as django_settings
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django_filters.rest_framework import DjangoFilterBackend
 from djoser.conf import settings
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
-from rest_framework.filters import SearchFilter
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.filters import RecipeFilter, RecipeFilterBackend
+from api.ingredient_index import ingredient_index
+from api.membership import membership_cache
+from api.pagination import (CustomPageNumberPagination,
+                            FeedCursorPagination, PantryCursorPagination,
+                            RecipeCursorPagination)
 from api.permissions import IsAuthor
+from api.uploads import RecipeImageUploadHandler
 from api.serializers import (CustomUserSerializer, FavoriteSerializer,
                              FollowSerializer, IngredientSerializer,
                              RecipeSerializer, RecipeWriteSerializer,
                              ShoppingCardSerializer, TagSerializer)
-from api.viewsets import ListRetriveViewSet, ListViewSet
-from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+from api.viewsets import CatalogViewSet, ListViewSet
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
                             ShoppingList, Tag)
 from users.models import User
 
 
-class IngredientViewSet(ListRetriveViewSet):
+class IngredientViewSet(CatalogViewSet):
     """Ингредиенты."""
 
+    catalog = 'ingredients'
+    cache_query_params = ('name',)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (DjangoFilterBackend, SearchFilter)
-    filterset_class = IngredientFilter
 
-
-class TagViewSet(ListRetriveViewSet):
+    def get_object(self):
+        try:
+            ingredient = ingredient_index.get(int(self.kwargs['pk']))
+        except ValueError:
+            ingredient = None
+        if ingredient is None:
+            raise Http404
+        return ingredient
+
+    def filter_queryset(self, queryset):
+        name = self.request.query_params.get('name')
+        if name:
+            return ingredient_index.search(
+                name, django_settings.INGREDIENT_SEARCH_LIMIT
+            )
+        return ingredient_index.all()
+
+
+class TagViewSet(CatalogViewSet):
     """Теги."""
 
+    catalog = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
@@ -42,26 +67,28 @@ class TagViewSet(ListRetriveViewSet):
 class RecipeViewSet(viewsets.ModelViewSet):
     """Рецепты."""
 
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (RecipeFilterBackend, )
     filterset_class = RecipeFilter
     ordering = ('-pub_date',)
+    parser_classes = (JSONParser, MultiPartParser)
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [RecipeImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    @property
+    def pagination_class(self):
+        request = getattr(self, 'request', None)
+        if (request is None
+                or RecipeCursorPagination.cursor_query_param
+                not in request.query_params):
+            return CustomPageNumberPagination
+        if request.query_params.get('ingredients'):
+            return PantryCursorPagination
+        return RecipeCursorPagination
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_authenticated:
-            return Recipe.objects.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
-                ),
-                is_in_shopping_cart=Exists(
-                    ShoppingList.objects.filter(user=user,
-                                                recipe=OuterRef('pk'))
-                )
-            ).all()
-        return Recipe.objects.annotate(
-            is_favorited=Value(False),
-            is_in_shopping_cart=Value(False)
-        ).all()
+        return Recipe.objects.select_related('author')
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -91,7 +118,9 @@ class ListSubscribeViewSet(ListViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return user.follower.all()
+        return user.follower.select_related('author').order_by(
+            *self.ordering
+        )
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -137,6 +166,7 @@ def add_object(request, model_serializer, recipe_id):
     serializer.is_valid(raise_exception=True)
     serializer.save(user=request.user,
                     recipe=get_object_or_404(Recipe, id=recipe_id))
+    membership_cache.invalidate_on_commit(request.user)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -147,6 +177,7 @@ def del_object(request, model, recipe_id):
         user=request.user,
         recipe=get_object_or_404(Recipe, id=recipe_id)
     ).delete()
+    membership_cache.invalidate_on_commit(request.user)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -165,28 +196,56 @@ def add_del_subscribe(request, user_id):
             context={'request': request, 'user_id': user_id}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user, author=author)
+        with transaction.atomic():
+            serializer.save(user=request.user, author=author)
+            FeedEntry.objects.add_author(request.user.id, author.id)
+            membership_cache.invalidate_on_commit(request.user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     serializer = FollowSerializer(
         data=request.data,
         context={'request': request, 'user_id': user_id}
     )
     serializer.is_valid(raise_exception=True)
-    Follow.objects.filter(
-        user=request.user,
-        author=author
-    ).delete()
+    with transaction.atomic():
+        Follow.objects.filter(
+            user=request.user,
+            author=author
+        ).delete()
+        FeedEntry.objects.remove_author(request.user.id, author.id)
+        membership_cache.invalidate_on_commit(request.user)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def feed_view(request):
+    """Лента рецептов авторов, на которых подписан пользователь."""
+
+    paginator = FeedCursorPagination()
+    page = paginator.paginate_queryset(
+        FeedEntry.objects.sources(request.user.id), request
+    )
+    recipes = Recipe.objects.select_related('author').in_bulk(
+        [entry.recipe_id for entry in page]
+    )
+    serializer = RecipeSerializer(
+        [recipes[entry.recipe_id] for entry in page if entry.recipe_id
+         in recipes],
+        many=True,
+        context={'request': request}
+    )
+    return paginator.get_paginated_response(serializer.data)
+
+
 @api_view(['POST', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def add_del_shopping_cart(request, recipe_id):
     """Добавить/удалить список покупок."""
 
-    if request.method == 'POST':
-        return add_object(request, ShoppingCardSerializer, recipe_id)
-    return del_object(request, ShoppingList, recipe_id)
+    with transaction.atomic():
+        if request.method == 'POST':
+            return add_object(request, ShoppingCardSerializer, recipe_id)
+        return del_object(request, ShoppingList, recipe_id)
 
 
 @api_view(['POST', 'DELETE'])
@@ -194,6 +253,7 @@ def add_del_shopping_cart(request, recipe_id):
 def favorite_view(request, recipe_id):
     """Добавить/удалить из избранного."""
 
-    if request.method == 'POST':
-        return add_object(request, FavoriteSerializer, recipe_id)
-    return del_object(request, Favorite, recipe_id)
+    with transaction.atomic():
+        if request.method == 'POST':
+            return add_object(request, FavoriteSerializer, recipe_id)
+        return del_object(request, Favorite, recipe_id)
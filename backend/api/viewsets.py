@@ -1,4 +1,14 @@
-from rest_framework import mixins, viewsets
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import mixins, status, viewsets
+from rest_framework.renderers import JSONRenderer
+
+from api.catalog import get_version
 
 
 class ListRetriveViewSet(
@@ -18,3 +28,68 @@ class ListViewSet(
     """Вьюсет только для list."""
 
     pass
+
+
+class CatalogViewSet(ListRetriveViewSet):
+    """Вьюсет справочника с условными запросами и кэшем ответов.
+
+    ETag и Last-Modified строятся по версии справочника catalog, поэтому
+    повторный запрос клиента с теми же заголовками получает 304 после
+    одного запроса версии. Готовые JSON-ответы кэшируются до смены версии.
+    """
+
+    catalog = None
+    cache_timeout = 60 * 60 * 24
+    cache_query_params = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request,
+                                    *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = get_version(self.catalog)
+        etag = f'"{self.catalog}-{version}"'
+        last_modified = version // 10 ** 9
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = self.get_cached_response(handler, request, version,
+                                                *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+    def get_cache_key(self, request, version, **kwargs):
+        """Ключ по действию, pk и только учитываемым параметрам запроса.
+
+        Остальные параметры ответа не меняют, поэтому не должны плодить
+        записи в кэше.
+        """
+        params = urlencode([
+            (name, request.query_params.get(name, ''))
+            for name in self.cache_query_params
+        ])
+        digest = md5(
+            f'{self.action}:{kwargs.get(self.lookup_field, "")}:{params}'
+            .encode()
+        ).hexdigest()
+        return f'catalog:{self.catalog}:{version}:{digest}'
+
+    def get_cached_response(self, handler, request, version, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request, version, **kwargs)
+        content = cache.get(key)
+        if content is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = JSONRenderer().render(response.data)
+            cache.set(key, content, self.cache_timeout)
+        return HttpResponse(content, content_type='application/json')
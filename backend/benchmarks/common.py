@@ -0,0 +1,24 @@
+import os
+from statistics import median
+from time import perf_counter
+
+import django
+
+
+def setup():
+    """Настраивает Django на benchmarks.settings и применяет миграции."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+
+
+def measure(func, repeat):
+    """Медиана времени выполнения func в миллисекундах и её результат."""
+    times = []
+    for _ in range(repeat):
+        started = perf_counter()
+        result = func()
+        times.append((perf_counter() - started) * 1000)
+    return median(times), result
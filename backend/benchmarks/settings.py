@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+from foodgram.settings import *  # noqa: F401,F403
+
+BENCHMARK_DIR = os.getenv('BENCHMARK_DIR') or tempfile.mkdtemp(
+    prefix='foodgram-benchmarks-'
+)
+
+SECRET_KEY = 'benchmarks'
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['*']
+
+if os.getenv('BENCHMARK_DATABASE', 'sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BENCHMARK_DIR, 'db.sqlite3'),
+        }
+    }
+else:
+    DATABASES['default']['NAME'] = os.getenv(  # noqa: F405
+        'BENCHMARK_POSTGRES_DB', 'foodgram_benchmarks'
+    )
+
+MEDIA_ROOT = os.path.join(BENCHMARK_DIR, 'media')
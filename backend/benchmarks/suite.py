@@ -0,0 +1,234 @@
+"""Нагрузочные бенчмарки API с проверкой регрессий.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --save-baseline
+    BENCHMARK_DATABASE=postgresql python -m benchmarks.suite
+
+Запросы проходят через полный стек Django (middleware, api/urls.py,
+аутентификацию по токену) без сетевого сервера. Для каждого сценария
+считаются p50/p95/p99 времени ответа и число SQL-запросов. С ключом
+--save-baseline результаты записываются в JSON, без него сравниваются
+с сохранёнными: команда завершается с ошибкой, если p95 вырос больше
+чем на --threshold или стало больше SQL-запросов.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.common import setup
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = max(math.ceil(len(values) * percent / 100) - 1, 0)
+    return values[index]
+
+
+class Scenario:
+    """Сценарий: последовательность запросов одного вида."""
+
+    def __init__(self, name, requests):
+        self.name = name
+        self.requests = requests
+
+
+def build_scenarios(context):
+    user = context['user']
+    recipe_ids = context['recipe_ids']
+    free_ids = context['free_recipe_ids']
+    ingredients = ','.join(map(str, context['ingredient_ids'][:5]))
+
+    def get(url):
+        return lambda: ('get', url)
+
+    def toggle(url_pattern):
+        state = {'index': 0, 'added': False}
+
+        def request():
+            recipe_id = free_ids[state['index'] % len(free_ids)]
+            method = 'delete' if state['added'] else 'post'
+            if state['added']:
+                state['index'] += 1
+            state['added'] = not state['added']
+            return method, url_pattern.format(recipe_id)
+        return request
+
+    detail_ids = iter(recipe_ids * 1000)
+    return [
+        Scenario('recipes-list', get('/api/recipes/?page=1&limit=6')),
+        Scenario('recipes-list-tags',
+                 get('/api/recipes/?tags=breakfast&tags=dinner&limit=6')),
+        Scenario('recipes-list-favorited',
+                 get('/api/recipes/?is_favorited=1&limit=6')),
+        Scenario('recipes-list-author',
+                 get(f'/api/recipes/?author={user.id}&limit=6')),
+        Scenario('recipes-list-search',
+                 get(f'/api/recipes/?search={context["search"]}&limit=6')),
+        Scenario('recipes-list-pantry',
+                 get(f'/api/recipes/?ingredients={ingredients}&limit=6')),
+        Scenario('recipes-cursor', get('/api/recipes/?cursor=&limit=6')),
+        Scenario('recipes-feed', get('/api/recipes/feed/?limit=6')),
+        Scenario('recipes-detail',
+                 lambda: ('get', f'/api/recipes/{next(detail_ids)}/')),
+        Scenario('subscriptions',
+                 get('/api/users/subscriptions/?page=1&limit=6'
+                     '&recipes_limit=3')),
+        Scenario('favorite-toggle', toggle('/api/recipes/{}/favorite/')),
+        Scenario('shopping-cart-toggle',
+                 toggle('/api/recipes/{}/shopping_cart/')),
+        Scenario('download-shopping-cart',
+                 get('/api/recipes/download_shopping_cart/')),
+    ]
+
+
+def run_scenario(client, scenario, requests, warmup):
+    from django.db import connections
+
+    from api.metrics import RequestStats
+
+    latencies, queries = [], []
+    for number in range(warmup + requests):
+        method, url = scenario.requests()
+        stats = RequestStats()
+        wrappers = [connection.execute_wrapper(stats)
+                    for connection in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        started = perf_counter()
+        try:
+            response = getattr(client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        finally:
+            elapsed = perf_counter() - started
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        if response.status_code >= 400:
+            raise SystemExit(f'{scenario.name}: {method.upper()} {url} '
+                             f'вернул {response.status_code}')
+        if number >= warmup:
+            latencies.append(elapsed * 1000)
+            queries.append(stats.queries)
+    return {
+        'p50': round(percentile(latencies, 50), 3),
+        'p95': round(percentile(latencies, 95), 3),
+        'p99': round(percentile(latencies, 99), 3),
+        'queries': max(queries),
+    }
+
+
+def compare(results, baseline, threshold):
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['p95'] > expected['p95'] * (1 + threshold):
+            failures.append(
+                f'{name}: p95 {result["p95"]:.2f} мс, '
+                f'базовый {expected["p95"]:.2f} мс'
+            )
+        if result['queries'] > expected['queries']:
+            failures.append(
+                f'{name}: {result["queries"]} SQL-запросов, '
+                f'базовый {expected["queries"]}'
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', action='append',
+                        help='запустить только указанные сценарии')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='допустимый рост p95, по умолчанию 25%%')
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    from recipes.models import Favorite, Ingredient, Recipe, ShoppingList
+    from users.models import User
+
+    call_command('flush', interactive=False, verbosity=0)
+    started = perf_counter()
+    call_command('generate_dataset', users=args.users, recipes=args.recipes,
+                 seed=args.seed, stdout=StringIO())
+    print(f'Данные созданы за {perf_counter() - started:.1f} с: '
+          f'{args.users} пользователей, {args.recipes} рецептов')
+
+    user = User.objects.order_by('id').first()
+    busy = set(Favorite.objects.filter(user=user).values_list(
+        'recipe_id', flat=True
+    )) | set(ShoppingList.objects.filter(user=user).values_list(
+        'recipe_id', flat=True
+    ))
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    random.Random(args.seed).shuffle(recipe_ids)
+    context = {
+        'search': Recipe.objects.order_by('id').values_list(
+            'name', flat=True
+        ).first().split()[0],
+        'user': user,
+        'recipe_ids': recipe_ids,
+        'free_recipe_ids': [pk for pk in recipe_ids if pk not in busy],
+        'ingredient_ids': list(Ingredient.objects.values_list(
+            'id', flat=True
+        )[:5]),
+    }
+    token, _ = Token.objects.get_or_create(user=user)
+    client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    results = {}
+    print(f'{"сценарий":<24} {"p50, мс":>9} {"p95, мс":>9} '
+          f'{"p99, мс":>9} {"SQL":>5}')
+    for scenario in build_scenarios(context):
+        if args.only and scenario.name not in args.only:
+            continue
+        result = run_scenario(client, scenario, args.requests, args.warmup)
+        results[scenario.name] = result
+        print(f'{scenario.name:<24} {result["p50"]:>9.2f} '
+              f'{result["p95"]:>9.2f} {result["p99"]:>9.2f} '
+              f'{result["queries"]:>5}')
+
+    if args.save_baseline:
+        baseline = {}
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text())
+        baseline.update(results)
+        args.baseline.write_text(
+            json.dumps(baseline, indent=2, ensure_ascii=False) + '\n'
+        )
+        print(f'Базовые значения сохранены в {args.baseline}')
+        return
+    if not args.baseline.exists():
+        print('Базовых значений нет, сравнивать не с чем.')
+        return
+    failures = compare(results, json.loads(args.baseline.read_text()),
+                       args.threshold)
+    if failures:
+        print('Регрессии:', *failures, sep='\n  ')
+        sys.exit(1)
+    print('Регрессий нет.')
+
+
+if __name__ == '__main__':
+    main()
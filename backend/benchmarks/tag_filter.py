@@ -0,0 +1,92 @@
+"""Фильтрация рецептов по нескольким тегам: JOIN против EXISTS.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.tag_filter --recipes 20000 --tags 20
+
+Сравниваются фильтр через JOIN по tags__slug (как было раньше, с
+повторами строк и без них через DISTINCT) и текущий RecipeFilter,
+который проверяет slug по кэшированному словарю и фильтрует через
+EXISTS по промежуточной таблице.
+"""
+import argparse
+import random
+
+from benchmarks.common import measure, setup
+
+
+def seed(recipes, tags, max_tags):
+    from recipes.models import Recipe, Tag
+    from users.models import User
+
+    author = User.objects.create(
+        email='tags@example.com', username='tags',
+        first_name='Tags', last_name='Benchmark'
+    )
+    Tag.objects.bulk_create([
+        Tag(name=f'Тег {number}', slug=f'tag-{number}',
+            color=f'#{number:06x}')
+        for number in range(tags)
+    ])
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    Recipe.objects.bulk_create([
+        Recipe(name=f'Рецепт {number}', text='benchmark', cooking_time=10,
+               image='recipes/benchmark.png', author=author)
+        for number in range(recipes)
+    ], batch_size=1000)
+    rng = random.Random(0)
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in Recipe.objects.values_list('id', flat=True)
+        for tag_id in rng.sample(tag_ids, rng.randint(1, max_tags))
+    ], batch_size=1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--tags', type=int, default=20)
+    parser.add_argument('--max-tags', type=int, default=4)
+    parser.add_argument('--filter-tags', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from django.http import QueryDict
+    from django.test.utils import CaptureQueriesContext
+
+    from api.filters import RecipeFilter
+    from recipes.models import Recipe
+
+    seed(args.recipes, args.tags, args.max_tags)
+    slugs = [f'tag-{number}' for number in range(args.filter_tags)]
+    data = QueryDict(mutable=True)
+    data.setlist('tags', slugs)
+    strategies = {
+        'join': lambda: Recipe.objects.filter(tags__slug__in=slugs),
+        'join+distinct': lambda: Recipe.objects.filter(
+            tags__slug__in=slugs
+        ).distinct(),
+        'exists': lambda: RecipeFilter(
+            data, queryset=Recipe.objects.all()
+        ).qs,
+    }
+    print(f'Рецептов {args.recipes}, тегов {args.tags}, '
+          f'фильтр по {args.filter_tags} тегам')
+    print(f'{"способ":<14} {"count":>7} {"count, мс":>10} '
+          f'{"страница, мс":>13} {"запросов":>9}')
+    for name, build in strategies.items():
+        count_time, count = measure(lambda: build().count(), args.repeat)
+        page_time, _ = measure(
+            lambda: list(build()[:args.limit]), args.repeat
+        )
+        with CaptureQueriesContext(connection) as queries:
+            list(build()[:args.limit])
+        print(f'{name:<14} {count:>7} {count_time:>10.2f} '
+              f'{page_time:>13.2f} {len(queries):>9}')
+
+
+if __name__ == '__main__':
+    main()
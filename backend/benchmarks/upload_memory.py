@@ -0,0 +1,159 @@
+"""Пиковая память при загрузке фото рецепта: base64 в JSON и multipart.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.upload_memory --width 4000 --height 3000
+
+Тело запроса собирается заранее и передаётся в WSGI-обработчик напрямую,
+поэтому в замер попадает только разбор запроса и сохранение рецепта.
+Память считается через tracemalloc, то есть учитываются объекты Python;
+буферы Pillow при декодировании изображения в замер не входят и
+одинаковы для обоих способов.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tracemalloc
+from io import BytesIO
+from time import perf_counter
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+from benchmarks.common import setup
+
+URL = '/api/recipes/'
+
+
+def make_photo(width, height):
+    from PIL import Image
+
+    image = Image.frombytes('RGB', (width, height),
+                            os.urandom(width * height * 3))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def json_body(photo, fields):
+    data = dict(fields, image='data:image/jpeg;base64,'
+                + base64.b64encode(photo).decode())
+    return json.dumps(data).encode(), 'application/json'
+
+
+def multipart_body(photo, fields):
+    boundary = uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="image"; '
+        f'filename="photo.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode()
+        + photo + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def make_environ(body, content_type, token):
+    return {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': urlsplit(URL).path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_AUTHORIZATION': f'Token {token}',
+        'wsgi.input': BytesIO(body),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.version': (1, 0),
+    }
+
+
+def measure(handler, environ):
+    statuses = []
+    tracemalloc.start()
+    started = perf_counter()
+    response = handler(environ, lambda status, headers: statuses.append(
+        status
+    ))
+    b''.join(response)
+    response.close()
+    elapsed = perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statuses[0], peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from rest_framework.authtoken.models import Token
+
+    from recipes.models import Ingredient, Tag
+    from users.models import User
+
+    settings.RECIPE_IMAGE_MAX_SIZE = 64 * 1024 * 1024
+    user, _ = User.objects.get_or_create(
+        email='benchmark@example.com',
+        defaults={'username': 'benchmark', 'first_name': 'Benchmark',
+                  'last_name': 'User'}
+    )
+    token, _ = Token.objects.get_or_create(user=user)
+    tag, _ = Tag.objects.get_or_create(
+        slug='benchmark', defaults={'name': 'Benchmark', 'color': '#000000'}
+    )
+    ingredient, _ = Ingredient.objects.get_or_create(
+        name='benchmark', defaults={'measurement_unit': 'г'}
+    )
+    handler = WSGIHandler()
+    photo = make_photo(args.width, args.height)
+    print(f'Фото {args.width}x{args.height}, '
+          f'{len(photo) / 2 ** 20:.1f} МиБ')
+    print(f'{"способ":<10} {"тело, МиБ":>10} {"пик, МиБ":>10} '
+          f'{"время, с":>10}')
+    for name, build in (('base64', json_body), ('multipart', multipart_body)):
+        peaks, times = [], []
+        for _ in range(args.repeat):
+            fields = {
+                'name': f'benchmark-{uuid4().hex}',
+                'text': 'benchmark',
+                'cooking_time': 1,
+                'tags': [tag.id],
+                'ingredients': [{'id': ingredient.id, 'amount': 1}],
+            }
+            body, content_type = build(photo, fields)
+            status, peak, elapsed = measure(
+                handler, make_environ(body, content_type, token.key)
+            )
+            if not status.startswith('201'):
+                raise SystemExit(f'{name}: ответ {status}')
+            peaks.append(peak)
+            times.append(elapsed)
+        print(f'{name:<10} {len(body) / 2 ** 20:>10.1f} '
+              f'{max(peaks) / 2 ** 20:>10.1f} {min(times):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +73,19 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -122,3 +136,33 @@ REST_FRAMEWORK = {
 DJOSER = {
     'LOGIN_FIELD': 'email'
 }
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+RECIPE_CACHE_TIMEOUT = 60 * 60
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+MEMBERSHIP_CACHE = {
+    'BACKEND': os.getenv('MEMBERSHIP_CACHE_BACKEND',
+                         'api.membership.LocalMembershipBackend'),
+    'OPTIONS': {
+        'timeout': 300,
+    },
+}
+
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+
+RECIPE_IMAGE_FORMATS = ('webp', 'jpeg')
+
+RECIPE_IMAGE_QUALITY = 80
+
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE',
+                                      10 * 1024 * 1024))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
-from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
-                            Recipe, ShoppingList, Tag)
+from recipes.models import (Follow, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingList, Tag)
 
 
 class TagsInline(admin.TabularInline):
@@ -17,6 +17,7 @@ class IngredientsInline(admin.TabularInline):
     model = Recipe.ingredients.through
     extra = 3
     min_num = 1
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Ingredient)
@@ -27,7 +28,7 @@ class IngredientAdmin(admin.ModelAdmin):
         'name',
         'measurement_unit'
     )
-    list_filter = ('name',)
+    ordering = ('name',)
     list_per_page = 50
     search_fields = ('name',)
     search_help_text = ('Поиск по названию',)
@@ -78,19 +79,19 @@ class RecipeAdmin(admin.ModelAdmin):
         'tags',
         'favorite_count'
     )
-    search_fields = ('name', 'author__username', 'tags__name')
+    search_fields = ('name', 'author__username')
     readonly_fields = ('favorite_count',)
-    list_filter = (
-        'author',
-        'name',
-        'tags'
-    )
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
+    list_per_page = 50
 
     @admin.display(
         description='Сколько раз добавили в избранное',
+        ordering='favorites_count',
     )
     def favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
 
 @admin.register(Follow)
@@ -101,6 +102,8 @@ class FollowAdmin(admin.ModelAdmin):
         'user',
         'author'
     )
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
 
 
 @admin.register(IngredientInRecipe)
@@ -112,6 +115,8 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
         'ingredient',
         'amount'
     )
+    list_select_related = ('recipe', 'ingredient')
+    raw_id_fields = ('recipe', 'ingredient')
 
 
 @admin.register(ShoppingList)
@@ -122,3 +127,5 @@ class ShoppingListAdmin(admin.ModelAdmin):
         'recipe',
         'user'
     )
+    list_select_related = ('recipe', 'user')
+    raw_id_fields = ('recipe', 'user')
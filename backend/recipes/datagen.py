@@ -0,0 +1,306 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from recipes.images import generate_variants
+from recipes.loaders import BulkLoader, IngredientLoader, batched
+from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingList, Tag)
+from users.models import User
+
+PLACEHOLDER_IMAGE = 'backend-media/recipes/images/placeholder.jpg'
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+TAG_COUNT_WEIGHTS = (0.5, 0.35, 0.15)
+
+AMOUNT_RANGES = {
+    'г': (10, 500),
+    'мл': (10, 500),
+    'кг': (1, 3),
+}
+
+PARETO_ALPHA = 1.5
+
+PUBLICATION_DAYS = 365
+
+
+def zipf_weights(size, skew):
+    """Накопленные веса закона Ципфа для рангов 1..size."""
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+def skewed_count(rng, mean, limit):
+    """Число с распределением Парето, средним mean и не больше limit."""
+    scale = mean * (PARETO_ALPHA - 1) / PARETO_ALPHA
+    return min(int(rng.paretovariate(PARETO_ALPHA) * scale), limit)
+
+
+def weighted_sample(rng, population, cum_weights, k):
+    """k разных элементов population, выбранных с весами cum_weights.
+
+    Редкие элементы с маленьким весом выпадают долго, поэтому после
+    нескольких попыток недостающие добираются равномерно.
+    """
+    k = min(k, len(population))
+    chosen = set()
+    for _ in range(5):
+        if len(chosen) >= k:
+            break
+        chosen.update(rng.choices(population, cum_weights=cum_weights,
+                                  k=k - len(chosen)))
+    while len(chosen) < k:
+        chosen.add(rng.choice(population))
+    return list(chosen)
+
+
+class Popularity:
+    """Элементы в случайном порядке рангов с весами закона Ципфа."""
+
+    def __init__(self, rng, items, skew):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = zipf_weights(len(self.items), skew)
+
+    def choice(self, rng):
+        return rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, rng, k):
+        return weighted_sample(rng, self.items, self.cum_weights, k)
+
+
+class TableLoader(BulkLoader):
+    """Пакетная вставка готовых строк в таблицу модели.
+
+    Значения уже подготовлены для базы, поэтому без COPY строки
+    вставляются через executemany, минуя создание объектов моделей.
+    """
+
+    def __init__(self, model, fields, **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+        self.fields = fields
+
+    def insert_batch(self, batch):
+        ops = connection.ops
+        columns = ', '.join(ops.quote_name(field) for field in self.fields)
+        placeholders = ', '.join(['%s'] * len(self.fields))
+        sql = (
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{self.model._meta.db_table} ({columns}) '
+            f'VALUES ({placeholders}) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                [row[field] for field in self.fields] for row in batch
+            ])
+
+
+def placeholder_image(storage=default_storage):
+    """Общее для всех рецептов фото-заглушка и его уменьшенные копии."""
+    if not storage.exists(PLACEHOLDER_IMAGE):
+        width = max(settings.RECIPE_IMAGE_WIDTHS)
+        image = Image.new('RGB', (width, width * 3 // 4), '#F5E6CC')
+        ImageDraw.Draw(image).ellipse(
+            (width // 4, width // 8, width * 3 // 4, width * 5 // 8),
+            fill='#E26C2D'
+        )
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=settings.RECIPE_IMAGE_QUALITY)
+        storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+    with storage.open(PLACEHOLDER_IMAGE, 'rb') as file:
+        return PLACEHOLDER_IMAGE, generate_variants(file, storage)
+
+
+class DatasetGenerator:
+    """Генерация воспроизводимого набора данных с перекосом популярности.
+
+    Число рецептов у авторов, подписчиков, добавлений в избранное и в
+    списки покупок распределено по степенному закону: немногие авторы и
+    рецепты собирают большую часть подписок и избранного. Одинаковый seed
+    на пустой базе даёт одинаковые данные.
+    """
+
+    def __init__(self, seed=0, skew=1.0, batch_size=5000, use_copy=True,
+                 progress=None):
+        self.rng = random.Random(seed)
+        self.skew = skew
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.progress = progress or (lambda message: None)
+
+    def loader(self, model, fields):
+        return TableLoader(model, fields, batch_size=self.batch_size,
+                           use_copy=self.use_copy)
+
+    def load_catalog(self, ingredients_path):
+        loader = IngredientLoader(batch_size=self.batch_size,
+                                  use_copy=self.use_copy)
+        loader.load(loader.read(ingredients_path))
+        Tag.objects.bulk_create([
+            Tag(name=name, color=color, slug=slug)
+            for name, color, slug in DEFAULT_TAGS
+        ], ignore_conflicts=True)
+        self.ingredients = {
+            ingredient_id: (name, unit)
+            for ingredient_id, name, unit in Ingredient.objects.order_by(
+                'id'
+            ).values_list('id', 'name', 'measurement_unit')
+        }
+        self.ingredient_popularity = Popularity(
+            self.rng, self.ingredients, self.skew
+        )
+        self.tag_popularity = Popularity(
+            self.rng, Tag.objects.order_by('id').values_list('id', flat=True),
+            self.skew
+        )
+
+    def create_users(self, count, prefix, password=None):
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise ValueError(
+                f'Пользователи с префиксом {prefix!r} уже существуют.'
+            )
+        password = make_password(password)
+        last_id = User.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        for batch in batched(range(count), self.batch_size):
+            User.objects.bulk_create([
+                User(username=f'{prefix}{number}',
+                     email=f'{prefix}{number}@example.com',
+                     first_name='Имя', last_name='Фамилия',
+                     password=password)
+                for number in batch
+            ])
+        self.user_ids = list(User.objects.filter(id__gt=last_id).order_by(
+            'id'
+        ).values_list('id', flat=True))
+        self.author_popularity = Popularity(self.rng, self.user_ids,
+                                            self.skew)
+        self.progress(f'Пользователей: {len(self.user_ids)}')
+
+    def recipe_rows(self, numbers, image, variants, pub_date):
+        """Строки рецептов и их теги и ингредиенты по названию."""
+        rows, contents = [], {}
+        for number in numbers:
+            ingredient_ids = self.ingredient_popularity.sample(
+                self.rng, self.rng.randint(5, 20)
+            )
+            tag_count = self.rng.choices(
+                range(1, len(TAG_COUNT_WEIGHTS) + 1), TAG_COUNT_WEIGHTS
+            )[0]
+            tag_ids = self.tag_popularity.sample(self.rng, tag_count)
+            main = self.ingredients[ingredient_ids[0]][0]
+            name = f'{main.capitalize()} №{number}'
+            contents[name] = (tag_ids, ingredient_ids)
+            rows.append({
+                'name': name,
+                'text': 'Основные ингредиенты: ' + ', '.join(
+                    self.ingredients[pk][0] for pk in ingredient_ids[:3]
+                ) + '.',
+                'cooking_time': self.rng.randint(5, 180),
+                'image': image,
+                'image_variants': variants,
+                'author_id': self.author_popularity.choice(self.rng),
+                'pub_date': pub_date(number),
+                'favorites_count': 0,
+                'in_feeds': False,
+            })
+        return rows, contents
+
+    def create_recipes(self, count):
+        image, variants = placeholder_image()
+        recipe_loader = self.loader(
+            Recipe, ('name', 'text', 'cooking_time', 'image',
+                     'image_variants', 'author_id', 'pub_date',
+                     'favorites_count', 'in_feeds')
+        )
+        variants = Recipe._meta.get_field(
+            'image_variants'
+        ).get_db_prep_save(variants, connection)
+        pub_date = Recipe._meta.get_field('pub_date')
+        started = timezone.now() - timedelta(days=PUBLICATION_DAYS)
+        step = timedelta(days=PUBLICATION_DAYS) / max(count, 1)
+        tag_loader = self.loader(Recipe.tags.through,
+                                 ('recipe_id', 'tag_id'))
+        ingredient_loader = self.loader(
+            IngredientInRecipe, ('recipe_id', 'ingredient_id', 'amount')
+        )
+        last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        self.recipe_ids = []
+        for numbers in batched(range(count), self.batch_size):
+            rows, contents = self.recipe_rows(
+                numbers, image, variants,
+                lambda number: pub_date.get_db_prep_save(
+                    started + step * number, connection
+                )
+            )
+            recipe_loader.load(rows)
+            recipe_ids = dict(Recipe.objects.filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('name', 'id'))
+            if len(recipe_ids) != len(rows):
+                raise ValueError('Часть рецептов уже существует.')
+            last_id = max(recipe_ids.values())
+            tag_loader.load(
+                {'recipe_id': recipe_ids[name], 'tag_id': tag_id}
+                for name, (tag_ids, _) in contents.items()
+                for tag_id in tag_ids
+            )
+            ingredient_loader.load(
+                {'recipe_id': recipe_ids[name], 'ingredient_id': pk,
+                 'amount': self.amount(pk)}
+                for name, (_, ingredient_ids) in contents.items()
+                for pk in ingredient_ids
+            )
+            self.recipe_ids.extend(recipe_ids.values())
+            self.progress(f'Рецептов: {len(self.recipe_ids)}')
+        self.recipe_popularity = Popularity(self.rng, self.recipe_ids,
+                                            self.skew)
+
+    def amount(self, ingredient_id):
+        unit = self.ingredients[ingredient_id][1]
+        return self.rng.randint(*AMOUNT_RANGES.get(unit, (1, 10)))
+
+    def create_follows(self, mean):
+        def rows():
+            for user_id in self.user_ids:
+                count = skewed_count(self.rng, mean, len(self.user_ids) - 1)
+                authors = self.author_popularity.sample(self.rng, count + 1)
+                for author_id in [pk for pk in authors
+                                  if pk != user_id][:count]:
+                    yield {'user_id': user_id, 'author_id': author_id}
+        total = self.loader(Follow, ('user_id', 'author_id')).load(rows())
+        self.progress(f'Подписок: {total}')
+
+    def create_memberships(self, model, mean):
+        def rows():
+            for user_id in self.user_ids:
+                count = skewed_count(self.rng, mean, len(self.recipe_ids))
+                for recipe_id in self.recipe_popularity.sample(self.rng,
+                                                               count):
+                    yield {'user_id': user_id, 'recipe_id': recipe_id}
+        total = self.loader(model, ('user_id', 'recipe_id')).load(rows())
+        self.progress(f'{model._meta.verbose_name_plural}: {total}')
+
+    def generate(self, ingredients_path, users, recipes, follows, favorites,
+                 cart, prefix='user', password=None):
+        self.load_catalog(ingredients_path)
+        self.create_users(users, prefix, password)
+        self.create_recipes(recipes)
+        self.create_follows(follows)
+        self.create_memberships(Favorite, favorites)
+        self.create_memberships(ShoppingList, cart)
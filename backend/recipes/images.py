@@ -0,0 +1,75 @@
+from hashlib import sha256
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+VARIANTS_DIR = 'backend-media/recipes/variants'
+
+PIL_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+
+def variant_widths(original_width):
+    """Ширины вариантов без увеличения исходного изображения."""
+    widths = {min(width, original_width)
+              for width in settings.RECIPE_IMAGE_WIDTHS}
+    return sorted(widths)
+
+
+def encode(image, width, format):
+    height = max(round(image.height * width / image.width), 1)
+    resized = image.resize((width, height), Image.LANCZOS)
+    if format == 'jpeg' and resized.mode != 'RGB':
+        background = Image.new('RGB', resized.size, 'white')
+        background.paste(resized, mask=resized.getchannel('A'))
+        resized = background
+    buffer = BytesIO()
+    resized.save(buffer, PIL_FORMATS[format],
+                 quality=settings.RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_variants(file, storage=default_storage):
+    """Уменьшенные копии изображения в форматах RECIPE_IMAGE_FORMATS.
+
+    Имена файлов строятся по sha256 исходника, поэтому одинаковые
+    изображения не пережимаются повторно. Возвращает словарь
+    {формат: [[имя файла, ширина], ...]} по возрастанию ширины.
+    """
+    hasher = sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    digest = hasher.hexdigest()[:32]
+    file.seek(0)
+    image = ImageOps.exif_transpose(Image.open(file))
+    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    variants = {}
+    for format in settings.RECIPE_IMAGE_FORMATS:
+        variants[format] = []
+        for width in variant_widths(image.width):
+            name = f'{VARIANTS_DIR}/{digest[:2]}/{digest}-{width}.{format}'
+            if not storage.exists(name):
+                name = storage.save(
+                    name, ContentFile(encode(image, width, format))
+                )
+            variants[format].append([name, width])
+    return variants
+
+
+def build_srcset(variants, request=None, storage=default_storage):
+    """Строки srcset для каждого формата из Recipe.image_variants."""
+    srcset = {}
+    for format, items in (variants or {}).items():
+        urls = []
+        for name, width in items:
+            url = storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls.append(f'{url} {width}w')
+        srcset[format] = ', '.join(urls)
+    return srcset
@@ -0,0 +1,302 @@
+import csv
+import json
+import re
+from collections import Counter
+from io import StringIO
+from itertools import islice
+from pathlib import Path
+
+from django.db import IntegrityError, connection, transaction
+
+from recipes.models import (FeedEntry, Ingredient, IngredientInRecipe,
+                            Recipe, Tag, update_counter)
+from users.models import User
+
+
+WHITESPACE = re.compile(r'[\s,]*')
+
+
+def read_json(path, fields, chunk_size=64 * 1024):
+    """Потоковое чтение JSON-массива объектов без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError('Ожидается JSON-массив.')
+        position = 1
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if buffer.startswith(']', position):
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError('', buffer, position)
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item
+
+
+def read_csv(path, fields):
+    """Чтение CSV: без заголовка колонки идут в порядке fields."""
+    with open(path, encoding='utf-8', newline='') as file:
+        first_line = file.readline()
+        file.seek(0)
+        has_header = next(csv.reader([first_line]), []) == list(fields)
+        reader = csv.DictReader(
+            file, fieldnames=None if has_header else fields
+        )
+        yield from reader
+
+
+def iter_ndjson(lines):
+    """Объекты из строк NDJSON, пустые строки пропускаются."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            raise ValueError(f'Строка {number}: {error}')
+
+
+def read_ndjson(path, fields):
+    """Чтение NDJSON: по одному объекту в строке."""
+    with open(path, encoding='utf-8') as file:
+        yield from iter_ndjson(file)
+
+
+READERS = {
+    'json': read_json,
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class BulkLoader:
+    """Пакетная загрузка строк справочника в базу.
+
+    Уже существующие записи пропускаются. На PostgreSQL плоские
+    справочники загружаются через COPY во временную таблицу.
+    """
+
+    model = None
+    fields = ()
+
+    def __init__(self, batch_size=1000, use_copy=True, progress=None):
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.progress = progress or (lambda processed: None)
+
+    def read(self, path, format=None):
+        format = format or Path(path).suffix.lstrip('.').lower()
+        try:
+            reader = READERS[format]
+        except KeyError:
+            raise ValueError(f'Неизвестный формат файла: {format}')
+        return reader(path, self.fields)
+
+    def prepare(self, row):
+        return {field: row[field] for field in self.fields}
+
+    def load(self, rows):
+        processed = 0
+        with transaction.atomic():
+            for batch in batched(rows, self.batch_size):
+                batch = [self.prepare(row) for row in batch]
+                if self.use_copy:
+                    self.copy_batch(batch)
+                else:
+                    self.insert_batch(batch)
+                processed += len(batch)
+                self.progress(processed)
+        return processed
+
+    def insert_batch(self, batch):
+        self.model.objects.bulk_create(
+            [self.model(**row) for row in batch],
+            ignore_conflicts=True
+        )
+
+    def copy_batch(self, batch):
+        table = self.model._meta.db_table
+        columns = ', '.join(self.fields)
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow([row[field] for field in self.fields])
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS load_{table} '
+                f'ON COMMIT DROP AS SELECT {columns} FROM {table} '
+                f'WITH NO DATA'
+            )
+            cursor.execute(f'TRUNCATE load_{table}')
+            cursor.cursor.copy_expert(
+                f'COPY load_{table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM load_{table} ON CONFLICT DO NOTHING'
+            )
+
+
+class IngredientLoader(BulkLoader):
+    """Загрузка ингредиентов."""
+
+    model = Ingredient
+    fields = ('name', 'measurement_unit')
+
+
+class TagLoader(BulkLoader):
+    """Загрузка тегов."""
+
+    model = Tag
+    fields = ('name', 'color', 'slug')
+
+
+class RecipeLoader(BulkLoader):
+    """Загрузка рецептов.
+
+    Автор указывается по username, теги по slug, ингредиенты по названию
+    или id. Рецепты с уже занятым названием пропускаются, повтор названия
+    в самих данных считается ошибкой.
+    """
+
+    model = Recipe
+    fields = ('name', 'text', 'cooking_time', 'image', 'author', 'tags',
+              'ingredients')
+    insert_attempts = 3
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.use_copy = False
+        self.tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredient_ids = dict(
+            Ingredient.objects.values_list('name', 'id')
+        )
+        self.known_ingredient_ids = set(self.ingredient_ids.values())
+        self.names = set()
+
+    def prepare(self, row):
+        row = dict(row)
+        for field in ('tags', 'ingredients'):
+            if isinstance(row.get(field), str):
+                row[field] = json.loads(row[field])
+        self.validate(row)
+        return row
+
+    def validate(self, row):
+        missing = [field for field in self.fields if not row.get(field)]
+        if missing:
+            raise ValueError(
+                f'Рецепт {row.get("name")!r}: не указаны поля {missing}'
+            )
+        name = row['name']
+        if name in self.names:
+            raise ValueError(f'Рецепт {name!r} встречается несколько раз')
+        self.names.add(name)
+        if int(row['cooking_time']) < 1:
+            raise ValueError(f'Рецепт {name!r}: неверное время готовки')
+        unknown = set(row['tags']).difference(self.tag_ids)
+        if unknown:
+            raise ValueError(f'Рецепт {name!r}: неизвестные теги {unknown}')
+        ingredient_ids = set()
+        for ingredient in row['ingredients']:
+            ingredient_id = self.get_ingredient_id(ingredient)
+            if ingredient_id is None:
+                raise ValueError(
+                    f'Рецепт {name!r}: неизвестный ингредиент {ingredient}'
+                )
+            if int(ingredient['amount']) < 1:
+                raise ValueError(
+                    f'Рецепт {name!r}: неверное количество {ingredient}'
+                )
+            ingredient_ids.add(ingredient_id)
+        if len(ingredient_ids) != len(row['ingredients']):
+            raise ValueError(f'Рецепт {name!r}: ингредиенты повторяются')
+
+    def get_ingredient_id(self, ingredient):
+        if 'id' in ingredient:
+            ingredient_id = int(ingredient['id'])
+            if ingredient_id in self.known_ingredient_ids:
+                return ingredient_id
+            return None
+        return self.ingredient_ids.get(ingredient.get('name'))
+
+    def insert_batch(self, batch):
+        authors = dict(User.objects.filter(
+            username__in={row['author'] for row in batch}
+        ).values_list('username', 'id'))
+        unknown = {row['author'] for row in batch}.difference(authors)
+        if unknown:
+            raise ValueError(f'Неизвестные авторы: {unknown}')
+        for attempt in range(self.insert_attempts):
+            existing = set(Recipe.objects.filter(
+                name__in=[row['name'] for row in batch]
+            ).values_list('name', flat=True))
+            batch = [row for row in batch if row['name'] not in existing]
+            try:
+                with transaction.atomic():
+                    Recipe.objects.bulk_create([
+                        Recipe(
+                            name=row['name'],
+                            text=row['text'],
+                            cooking_time=row['cooking_time'],
+                            image=row['image'],
+                            author_id=authors[row['author']]
+                        )
+                        for row in batch
+                    ])
+                break
+            except IntegrityError:
+                # Рецепт с тем же названием создан параллельно: вставка
+                # повторяется без него, чужие рецепты не затрагиваются.
+                if attempt == self.insert_attempts - 1:
+                    raise
+        recipe_ids = dict(Recipe.objects.filter(
+            name__in=[row['name'] for row in batch]
+        ).values_list('name', 'id'))
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_ids[row['name']],
+                                tag_id=self.tag_ids[slug])
+            for row in batch
+            for slug in row['tags']
+        ], ignore_conflicts=True)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe_id=recipe_ids[row['name']],
+                ingredient_id=self.get_ingredient_id(ingredient),
+                amount=ingredient['amount']
+            )
+            for row in batch
+            for ingredient in row['ingredients']
+        ])
+        FeedEntry.objects.add_recipes(recipe_ids.values())
+        created = Counter(authors[row['author']] for row in batch)
+        for author_id, count in created.items():
+            update_counter(User.objects.filter(pk=author_id),
+                           'recipes_count', count)
+
+
+LOADERS = {
+    'ingredients': IngredientLoader,
+    'tags': TagLoader,
+    'recipes': RecipeLoader,
+}
@@ -0,0 +1,91 @@
+from io import StringIO
+from time import monotonic
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.catalog import bump_version
+from recipes.datagen import DatasetGenerator
+from recipes.models import FeedEntry, ShoppingListIngredient
+
+
+class Command(BaseCommand):
+
+    help = ('Генерация пользователей, рецептов, подписок, избранного и '
+            'списков покупок для нагрузочного тестирования')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='среднее число подписок пользователя'
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=30,
+            help='среднее число рецептов в избранном пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=float, default=5,
+            help='среднее число рецептов в списке покупок пользователя'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.0,
+            help='показатель закона Ципфа для популярности'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='user',
+            help='префикс имён создаваемых пользователей'
+        )
+        parser.add_argument(
+            '--password',
+            help='пароль пользователей, по умолчанию вход по паролю закрыт'
+        )
+        parser.add_argument(
+            '--ingredients',
+            default=settings.BASE_DIR / 'data' / 'ingredients.csv',
+            help='справочник ингредиентов, по умолчанию data/ingredients.csv'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-copy', action='store_false', dest='use_copy',
+            help='Не использовать COPY на PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        generator = DatasetGenerator(
+            seed=options['seed'],
+            skew=options['skew'],
+            batch_size=options['batch_size'],
+            use_copy=options['use_copy'],
+            progress=lambda message: self.report(message, started)
+        )
+        try:
+            with transaction.atomic():
+                generator.generate(
+                    options['ingredients'],
+                    users=options['users'],
+                    recipes=options['recipes'],
+                    follows=options['follows'],
+                    favorites=options['favorites'],
+                    cart=options['cart'],
+                    prefix=options['prefix'],
+                    password=options['password']
+                )
+                ShoppingListIngredient.objects.rebuild()
+                call_command('reconcile_counters', stdout=StringIO())
+                FeedEntry.objects.rebuild()
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Ошибка при генерации данных: {error}')
+        for name in ('ingredients', 'tags', 'recipes'):
+            bump_version(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {monotonic() - started:.1f} с.'
+        ))
+
+    def report(self, message, started):
+        self.stdout.write(f'{message} ({monotonic() - started:.1f} с)')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from api.recipe_cache import bump_recipe_version
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+
+    help = 'Создание уменьшенных копий фото рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='пересоздать копии и для рецептов, у которых они уже есть'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only('id', 'image')
+        if not options['force']:
+            recipes = recipes.filter(image_variants={})
+        processed = 0
+        for recipe in recipes.iterator():
+            try:
+                with recipe.image.open('rb') as file:
+                    variants = generate_variants(file)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'Рецепт {recipe.id}: {error}')
+                continue
+            Recipe.objects.filter(pk=recipe.pk).update(
+                image_variants=variants
+            )
+            bump_recipe_version(recipe.pk)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии фото созданы для рецептов: {processed}'
+        ))
@@ -1,27 +1,58 @@
-import json
-import os
+from time import monotonic
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
-from recipes.models import Ingredient
+from api.catalog import bump_version
+from recipes.loaders import LOADERS, READERS
 
 
 class Command(BaseCommand):
 
-    help = 'Импорт ингридиентов'
-
-    path = os.path.abspath('data/ingredients.json')
-
-    def handle(self, *args, **kwargs):
-        with open(self.path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-
-        for note in data:
+    help = 'Импорт ингредиентов, тегов и рецептов из JSON, CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            default=[settings.BASE_DIR / 'data' / 'ingredients.json'],
+            help='Файлы для загрузки, по умолчанию data/ingredients.json'
+        )
+        parser.add_argument(
+            '--model', choices=LOADERS, default='ingredients',
+            help='Что загружать: ingredients, tags или recipes'
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy', action='store_false', dest='use_copy',
+            help='Не использовать COPY на PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        loader = LOADERS[options['model']](
+            batch_size=options['batch_size'],
+            use_copy=options['use_copy'],
+            progress=lambda processed: self.report(processed, started)
+        )
+        total = 0
+        for path in options['paths']:
             try:
-                Ingredient.objects.get_or_create(**note)
-                print(f'{note["name"]} записан в базу')
-            except Exception as error:
-                print(f'Ошибка при добавлении {note["name"]} в базу.\n'
-                      f'Ошибка: {error}')
-
-        print('Загрузка успешно завершена!')
+                total += loader.load(loader.read(path, options['format']))
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f'Ошибка при загрузке {path}: {error!r}')
+        bump_version(options['model'])
+        elapsed = monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка успешно завершена: {total} строк за {elapsed:.1f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с).'
+        ))
+
+    def report(self, processed, started):
+        elapsed = max(monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'Обработано {processed} строк, {processed / elapsed:.0f} строк/с'
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+
+    help = 'Пересборка лент подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя, по умолчанию пересобираются все ленты'
+        )
+
+    def handle(self, *args, **options):
+        created = FeedEntry.objects.rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны, записей: {created}'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListIngredient
+
+
+class Command(BaseCommand):
+
+    help = 'Пересчёт агрегированных списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя, по умолчанию пересчитываются все списки'
+        )
+
+    def handle(self, *args, **options):
+        created = ShoppingListIngredient.objects.rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны, строк: {created}'
+        ))
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.16 on 2026-10-18 07:17
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+search = import_module('recipes.migrations.0008_recipe_search')
+
+
+def restore_search(apps, schema_editor):
+    # На SQLite добавление и удаление поля пересоздаёт таблицу рецептов
+    # вместе с триггерами FTS5, поэтому они создаются заново.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in search.SQLITE_FORWARD[1:]:
+        schema_editor.execute(sql)
+
+
+def mark_in_feeds(apps, schema_editor):
+    # Рецепты, уже разосланные в ленты миграцией 0010.
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    Recipe.objects.update(in_feeds=Exists(User.objects.filter(
+        pk=OuterRef('author_id'),
+        followers_count__lte=settings.FEED_FANOUT_LIMIT
+    )))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_feeds',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Разослан в ленты подписчиков'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('in_feeds', False)), fields=['-pub_date', '-id'], name='recipe_not_in_feeds_idx'),
+        ),
+        migrations.RunPython(restore_search, migrations.RunPython.noop),
+        migrations.RunPython(mark_in_feeds, migrations.RunPython.noop),
+    ]
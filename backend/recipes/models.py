@@ -1,7 +1,19 @@
+from collections import Counter
+
+from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Case, Exists, F, OuterRef, Sum, Value, When,
+                              Window)
+from django.db.models.functions import Greatest, RowNumber
+
+from recipes.images import generate_variants
+from users.models import User, exclude_counters
+
 
-from users.models import User
+def update_counter(queryset, field, delta):
+    """Атомарно изменяет счётчик field на delta, не опуская его ниже нуля."""
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
 
 
 class Ingredient(models.Model):
@@ -49,6 +61,40 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeManager(models.Manager):
+    """Менеджер рецептов."""
+
+    def latest_by_authors(self, author_ids, limit=None):
+        """Последние рецепты каждого автора одним запросом.
+
+        Возвращает словарь {author_id: [рецепты]}; при заданном limit
+        рецепты каждого автора отбираются оконной функцией ROW_NUMBER().
+        """
+        recipes = {author_id: [] for author_id in author_ids}
+        if not recipes:
+            return recipes
+        queryset = self.filter(author_id__in=recipes).only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id'
+        ).order_by('-pub_date', '-id')
+        if limit is not None:
+            sql, params = queryset.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('pub_date').desc(), F('id').desc())
+                )
+            ).order_by().query.sql_with_params()
+            queryset = self.raw(
+                f'SELECT * FROM ({sql}) AS ranked '
+                f'WHERE row_number <= %s ORDER BY author_id, row_number',
+                (*params, limit)
+            )
+        for recipe in queryset:
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+
 class Recipe(models.Model):
     """Рецепт."""
 
@@ -92,15 +138,47 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'Сколько раз добавили в избранное',
+        default=0,
+        editable=False
+    )
+    image_variants = models.JSONField(
+        'Уменьшенные копии фото',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    in_feeds = models.BooleanField(
+        'Разослан в ленты подписчиков',
+        default=False,
+        editable=False
+    )
+
+    objects = RecipeManager()
+    counter_fields = ('favorites_count',)
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_not_in_feeds_idx',
+                         condition=models.Q(in_feeds=False)),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            self.image_variants = generate_variants(self.image)
+        super().save(*args, **exclude_counters(self, self.counter_fields,
+                                               kwargs))
+
 
 class IngredientInRecipe(models.Model):
     """Ингредиенты в рецепте."""
@@ -146,6 +224,10 @@ class Favorite(models.Model):
                 name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(fields=['user', 'recipe'],
+                         name='favorite_user_recipe_idx')
+        ]
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
 
@@ -174,6 +256,10 @@ class ShoppingList(models.Model):
                 name='unique_shopping_list'
             )
         ]
+        indexes = [
+            models.Index(fields=['user', 'recipe'],
+                         name='shopping_list_user_recipe_idx')
+        ]
         verbose_name = 'Рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списке покупок'
 
@@ -181,6 +267,118 @@ class ShoppingList(models.Model):
         return f'{self.recipe} в списке покупок у {self.user}'
 
 
+class ShoppingListIngredientManager(models.Manager):
+    """Обновление агрегированного списка покупок."""
+
+    def recipe_amounts(self, recipe_id):
+        amounts = Counter()
+        for ingredient_id, amount in IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount'):
+            amounts[ingredient_id] += amount
+        return amounts
+
+    def apply_delta(self, user_ids, delta):
+        """Прибавляет delta {ingredient_id: amount} к спискам пользователей.
+
+        Недостающие строки вставляются с нулём без ошибки при конфликте,
+        затем количество меняется одним атомарным UPDATE, поэтому
+        параллельные изменения одной строки не мешают друг другу. Строки с
+        неположительным количеством удаляются.
+        """
+        user_ids = list(user_ids)
+        delta = {key: value for key, value in delta.items() if value}
+        if not user_ids or not delta:
+            return
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=delta)
+        with transaction.atomic():
+            self.bulk_create([
+                self.model(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=0)
+                for user_id in user_ids
+                for ingredient_id, amount in delta.items()
+                if amount > 0
+            ], ignore_conflicts=True)
+            rows.update(amount=Greatest(F('amount') + Case(
+                *(When(ingredient_id=ingredient_id, then=Value(amount))
+                  for ingredient_id, amount in delta.items()),
+                output_field=models.IntegerField()
+            ), 0))
+            rows.filter(amount=0).delete()
+
+    def add_recipe(self, user_ids, recipe_id):
+        self.apply_delta(user_ids, self.recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_ids, recipe_id):
+        self.apply_delta(user_ids, {
+            ingredient_id: -amount for ingredient_id, amount
+            in self.recipe_amounts(recipe_id).items()
+        })
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        """Пересчитывает списки из ShoppingList и IngredientInRecipe."""
+        lookup = {'recipe__recipe_to_shopping__isnull': False}
+        existing = self.all()
+        if user_ids is not None:
+            lookup = {'recipe__recipe_to_shopping__user__in': user_ids}
+            existing = existing.filter(user_id__in=user_ids)
+        rows = IngredientInRecipe.objects.filter(**lookup).values(
+            'ingredient_id',
+            user_id=models.F('recipe__recipe_to_shopping__user')
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by()
+        with transaction.atomic():
+            existing.delete()
+            batch = []
+            created = 0
+            for row in rows.iterator():
+                batch.append(self.model(
+                    user_id=row['user_id'],
+                    ingredient_id=row['ingredient_id'],
+                    amount=row['total_amount']
+                ))
+                if len(batch) >= batch_size:
+                    created += len(self.bulk_create(batch))
+                    batch = []
+            created += len(self.bulk_create(batch))
+        return created
+
+
+class ShoppingListIngredient(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+
+    Обновляется при добавлении и удалении рецептов из списка покупок и при
+    изменении ингредиентов рецептов, находящихся в списке.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_list_ingredients',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingListIngredientManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient', ],
+                name='unique_shopping_list_ingredient'
+            )
+        ]
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+
+    def __str__(self):
+        return f'{self.ingredient} в списке покупок у {self.user}'
+
+
 class Follow(models.Model):
     """Подписки на пользователей."""
 
@@ -207,3 +405,169 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user} подписан на автора {self.author}'
+
+
+class FeedEntryManager(models.Manager):
+    """Ленты подписок: рецепты рассылаются подписчикам при публикации.
+
+    Рассылать ли рецепт, решается один раз при публикации: если у автора
+    подписчиков больше FEED_FANOUT_LIMIT, рецепт помечается in_feeds=False
+    и при выдаче ленты читается из таблицы рецептов. Поэтому изменение
+    числа подписчиков не теряет и не дублирует уже опубликованные рецепты.
+    """
+
+    fields = ('user', 'recipe', 'author', 'pub_date')
+
+    def timeline_rows(self, **lookup):
+        return Recipe.objects.filter(in_feeds=True, **lookup).order_by(
+        ).values_list(
+            'author__following__user_id', 'id', 'author_id', 'pub_date'
+        )
+
+    def insert(self, rows):
+        """Вставляет строки запроса rows одним INSERT ... SELECT.
+
+        Уже существующие записи пропускаются: ON CONFLICT DO NOTHING на
+        PostgreSQL, INSERT OR IGNORE на SQLite.
+        """
+        connection = connections[self.db]
+        ops = connection.ops
+        columns = ', '.join(
+            ops.quote_name(self.model._meta.get_field(field).column)
+            for field in self.fields
+        )
+        sql, params = rows.query.get_compiler(self.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{ops.insert_statement(ignore_conflicts=True)} '
+                f'{ops.quote_name(self.model._meta.db_table)} ({columns}) '
+                f'{sql} {ops.ignore_conflicts_suffix_sql(True)}',
+                params
+            )
+            return cursor.rowcount
+
+    def add_recipes(self, recipe_ids):
+        """Рассылает новые рецепты подписчикам их авторов."""
+        Recipe.objects.filter(
+            id__in=recipe_ids,
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT
+        ).update(in_feeds=True)
+        return self.insert(self.timeline_rows(
+            id__in=recipe_ids, author__following__isnull=False
+        ))
+
+    def add_author(self, user_id, author_id):
+        """Добавляет в ленту пользователя разосланные рецепты автора."""
+        return self.insert(self.timeline_rows(
+            author_id=author_id, author__following__user_id=user_id
+        ))
+
+    def remove_author(self, user_id, author_id):
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def sources(self, user_id):
+        """Запросы, из которых собирается лента пользователя.
+
+        Каждый отдаёт объекты с полями pub_date и recipe_id.
+        """
+        return [
+            self.filter(user_id=user_id).only('recipe_id', 'pub_date'),
+            Recipe.objects.filter(
+                in_feeds=False, author__following__user_id=user_id
+            ).annotate(recipe_id=F('id')).only('id', 'pub_date'),
+        ]
+
+    def rebuild(self, user_ids=None):
+        """Пересобирает ленты из подписок и рецептов.
+
+        Без user_ids заново решает для всех рецептов, рассылать ли их, по
+        текущему числу подписчиков авторов.
+        """
+        lookup = {'author__following__isnull': False}
+        existing = self.all()
+        if user_ids is not None:
+            lookup = {'author__following__user__in': user_ids}
+            existing = existing.filter(user_id__in=user_ids)
+        with transaction.atomic():
+            if user_ids is None:
+                Recipe.objects.update(in_feeds=Exists(User.objects.filter(
+                    pk=OuterRef('author_id'),
+                    followers_count__lte=settings.FEED_FANOUT_LIMIT
+                )))
+            existing.delete()
+            return self.insert(self.timeline_rows(**lookup))
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+        db_index=False
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='feed_entries',
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+        db_index=False
+    )
+    pub_date = models.DateTimeField('Дата добавления рецепта')
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe', ],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+        verbose_name = 'Рецепт в ленте подписок'
+        verbose_name_plural = 'Рецепты в лентах подписок'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте у {self.user}'
+
+
+class Version(models.Model):
+    """Версия данных, по которой процессы сбрасывают свои кэши.
+
+    Хранится в базе, а не в кэше Django, чтобы изменение, сделанное
+    командой управления или другим воркером, видели все процессы.
+    """
+
+    name = models.CharField('Название', max_length=64, primary_key=True)
+    value = models.BigIntegerField('Версия')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+
+class RecipeChange(models.Model):
+    """Запись журнала изменённых рецептов для индексов в памяти."""
+
+    recipe_id = models.IntegerField('ID рецепта')
+
+    class Meta:
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'
+
+    def __str__(self):
+        return f'{self.id}: {self.recipe_id}'
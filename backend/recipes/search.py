@@ -0,0 +1,73 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+WORD = re.compile(r'\w+')
+
+
+def fts5_query(query):
+    """Запрос FTS5: все слова, каждое как префикс."""
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+
+def postgresql_search(queryset, query):
+    tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+    return queryset.annotate(
+        search_match=RawSQL(
+            f'recipes_recipe.search_vector @@ {tsquery}', (query,),
+            output_field=BooleanField()
+        ),
+        search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})', (query,),
+            output_field=FloatField()
+        )
+    ).filter(search_match=True)
+
+
+def sqlite_search(queryset, query):
+    # bm25() доступна только в запросе с MATCH по самой таблице FTS5,
+    # поэтому таблица присоединяется к выборке, а не подзапросом.
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = recipes_recipe.id',
+               f'{FTS_TABLE} MATCH %s'],
+        params=[fts5_query(query)],
+        select={'search_rank': f'-bm25({FTS_TABLE}, 2.0, 1.0)'}
+    )
+
+
+def fallback_search(queryset, query):
+    condition = Q()
+    for word in WORD.findall(query):
+        condition &= Q(name__icontains=word) | Q(text__icontains=word)
+    return queryset.filter(condition)
+
+
+SEARCH_BACKENDS = {
+    'postgresql': postgresql_search,
+    'sqlite': sqlite_search,
+}
+
+
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск рецептов по названию и описанию.
+
+    На PostgreSQL используется хранимая колонка tsvector с индексом GIN,
+    на SQLite таблица FTS5, на остальных базах поиск по вхождению слов.
+    Найденные рецепты сортируются по релевантности, совпадения в
+    названии весят больше совпадений в описании.
+    """
+    if not WORD.search(query):
+        return queryset.none()
+    backend = SEARCH_BACKENDS.get(connection.vendor)
+    if backend is None:
+        return fallback_search(queryset, query)
+    return backend(queryset, query).order_by(
+        '-search_rank', '-pub_date', '-id'
+    )
@@ -0,0 +1,183 @@
+from django.test import TestCase
+
+from recipes.loaders import RecipeLoader
+
+from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingList, ShoppingListIngredient, Tag)
+from users.models import User
+
+
+class ShoppingListIngredientTests(TestCase):
+    """Инкрементальные суммы списка покупок совпадают с пересчётом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(email=f'user{number}@example.com',
+                                username=f'user{number}',
+                                first_name='Имя', last_name='Фамилия')
+            for number in range(2)
+        ]
+        cls.salt, cls.flour = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'мука')
+        ]
+        cls.bread, cls.pie = [
+            Recipe.objects.create(
+                name=name, text='Испечь.', cooking_time=60,
+                image='backend-media/recipes/images/bread.png',
+                author=cls.users[0]
+            )
+            for name in ('Хлеб', 'Пирог')
+        ]
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=cls.bread, ingredient=cls.salt,
+                               amount=5),
+            IngredientInRecipe(recipe=cls.bread, ingredient=cls.flour,
+                               amount=500),
+            IngredientInRecipe(recipe=cls.pie, ingredient=cls.flour,
+                               amount=300),
+        ])
+
+    def amounts(self):
+        return set(ShoppingListIngredient.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ))
+
+    def add(self, user, recipe):
+        ShoppingList.objects.create(user=user, recipe=recipe)
+
+    def assert_rebuilt(self):
+        amounts = self.amounts()
+        ShoppingListIngredient.objects.rebuild()
+        self.assertEqual(amounts, self.amounts())
+
+    def test_add_and_remove(self):
+        user = self.users[0]
+        self.add(user, self.bread)
+        self.add(user, self.pie)
+        self.assertEqual(self.amounts(), {
+            (user.id, self.salt.id, 5), (user.id, self.flour.id, 800)
+        })
+        self.assert_rebuilt()
+        ShoppingList.objects.filter(user=user, recipe=self.bread).delete()
+        self.assertEqual(self.amounts(), {(user.id, self.flour.id, 300)})
+        self.assert_rebuilt()
+
+    def test_recipe_changes_outside_api(self):
+        for user in self.users:
+            self.add(user, self.bread)
+        self.add(self.users[0], self.pie)
+        row = IngredientInRecipe.objects.get(recipe=self.pie)
+        row.amount = 200
+        row.save()
+        IngredientInRecipe.objects.create(recipe=self.pie,
+                                          ingredient=self.salt, amount=1)
+        self.assert_rebuilt()
+        self.bread.delete()
+        self.assertEqual(self.amounts(), {
+            (self.users[0].id, self.salt.id, 1),
+            (self.users[0].id, self.flour.id, 200),
+        })
+        self.assert_rebuilt()
+        IngredientInRecipe.objects.filter(ingredient=self.salt).delete()
+        self.assertEqual(self.amounts(),
+                         {(self.users[0].id, self.flour.id, 200)})
+
+    def test_existing_row_is_updated(self):
+        user = self.users[1]
+        ShoppingListIngredient.objects.create(
+            user=user, ingredient=self.flour, amount=300
+        )
+        ShoppingListIngredient.objects.apply_delta(
+            [user.id], {self.flour.id: 500, self.salt.id: 5}
+        )
+        self.assertEqual(self.amounts(), {
+            (user.id, self.salt.id, 5), (user.id, self.flour.id, 800)
+        })
+        ShoppingListIngredient.objects.apply_delta(
+            [user.id], {self.flour.id: -900, self.salt.id: -5}
+        )
+        self.assertEqual(self.amounts(), set())
+
+
+class CounterTests(TestCase):
+    """Счётчики меняются при любых создании и удалении, не только в API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = [
+            User.objects.create(
+                email=f'{username}@example.com', username=username,
+                first_name='Имя', last_name='Фамилия'
+            )
+            for username in ('author', 'reader')
+        ]
+        cls.recipe = Recipe.objects.create(
+            name='Хлеб', text='Испечь.', cooking_time=60,
+            image='backend-media/recipes/images/bread.png', author=cls.author
+        )
+
+    def counters(self):
+        self.author.refresh_from_db()
+        return (self.author.recipes_count, self.author.followers_count,
+                Recipe.objects.get(pk=self.recipe.pk).favorites_count)
+
+    def test_user_delete_cascade(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        self.assertEqual(self.counters(), (1, 1, 1))
+        self.reader.delete()
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+    def test_recipe_create_and_delete(self):
+        Recipe.objects.create(
+            name='Суп', text='Сварить.', cooking_time=30,
+            image='backend-media/recipes/images/soup.png', author=self.author
+        )
+        self.assertEqual(self.counters(), (2, 0, 0))
+        Recipe.objects.filter(name='Суп').delete()
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+
+class RecipeLoaderTests(TestCase):
+    """Загрузка рецептов пакетами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия'
+        )
+        Tag.objects.create(name='Ужин', color='#FFFFFF', slug='dinner')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        Recipe.objects.create(
+            name='Хлеб', text='Испечь.', cooking_time=60,
+            image='backend-media/recipes/images/bread.png', author=cls.author
+        )
+
+    def row(self, name, ingredient='соль'):
+        return {
+            'name': name, 'text': 'Приготовить.', 'cooking_time': 10,
+            'image': 'backend-media/recipes/images/soup.png',
+            'author': 'author', 'tags': ['dinner'],
+            'ingredients': [{'name': ingredient, 'amount': 1}],
+        }
+
+    def test_duplicate_names_are_rejected(self):
+        with self.assertRaises(ValueError):
+            RecipeLoader().load([
+                self.row('Суп'), self.row('Суп', 'мука'), self.row('Каша')
+            ])
+        self.assertFalse(Recipe.objects.filter(name='Суп').exists())
+
+    def test_existing_names_are_skipped(self):
+        RecipeLoader().load([self.row('Хлеб'), self.row('Суп')])
+        bread = Recipe.objects.get(name='Хлеб')
+        self.assertEqual(bread.ingredientinrecipe_set.count(), 0)
+        self.assertEqual(bread.tags.count(), 0)
+        soup = Recipe.objects.get(name='Суп')
+        self.assertEqual(soup.ingredientinrecipe_set.count(), 1)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
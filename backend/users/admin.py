@@ -13,6 +13,8 @@ class CustomUserAdmin(admin.ModelAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
+        'followers_count',
         'is_active'
     )
     list_editable = ('is_active',)
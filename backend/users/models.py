@@ -3,6 +3,24 @@ from django.core.validators import RegexValidator
 from django.db import models
 
 
+def exclude_counters(instance, counter_fields, kwargs):
+    """Исключает счётчики из сохранения уже существующего объекта.
+
+    Счётчики меняются только атомарным UPDATE, а значение в загруженном
+    объекте могло устареть, поэтому save() не должен его перезаписывать.
+    """
+    if (instance._state.adding or kwargs.get('force_insert')
+            or kwargs.get('update_fields') is not None):
+        return kwargs
+    skipped = set(counter_fields) | instance.get_deferred_fields()
+    kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.attname not in skipped
+        and field.name not in skipped
+    ]
+    return kwargs
+
+
 class User(AbstractUser):
     """Пользователь."""
 
@@ -37,9 +55,20 @@ class User(AbstractUser):
         max_length=150,
         blank=False
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -48,3 +77,7 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.username
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **exclude_counters(self, self.counter_fields,
+                                               kwargs))